@@ -0,0 +1,523 @@
+"""Двухуровневый кеш: LRU в памяти процесса перед общим хранилищем.
+
+L1 — небольшой LRU-словарь, общий для потоков одного процесса.
+L2 — хранилище, которое видят все воркеры: по умолчанию файл SQLite
+(SQLiteCache), либо любой другой кеш Django из CACHES (memcached,
+redis), обёрнутый в SharedCacheAdapter.
+
+Каждое изменение в L2 получает порядковый номер. Процессы раз в
+SYNC_INTERVAL секунд забирают ключи, изменённые после их последнего
+номера, и выбрасывают их из своего L1, так что сброс кеша в одном
+воркере доходит до остальных.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_missing = object()
+_l1_stores = {}
+_l1_stores_lock = threading.Lock()
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов на одном хосте.
+
+    Удаление оставляет надгробие, чтобы номер изменения дошёл до
+    других процессов. Надгробие живёт TOMBSTONE_TIMEOUT секунд из
+    OPTIONS — дольше любой копии в L1 вместе с паузой синхронизации;
+    просроченные строки и надгробия вычищаются при отсечении лишних
+    записей.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self.tombstone_timeout = params.get('OPTIONS', {}).get(
+            'TOMBSTONE_TIMEOUT', 60)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=10,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    expires REAL,
+                    seq INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cache_entries_seq
+                    ON cache_entries (seq);
+                CREATE TABLE IF NOT EXISTS cache_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    seq INTEGER NOT NULL,
+                    flush_seq INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO cache_state VALUES (1, 0, 0);
+            ''')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return connection
+
+    def _one(self, sql):
+        # fetchall дочитывает курсор: незавершённый SELECT держит
+        # снимок WAL, и соединение не видит чужих записей.
+        return self._connection.execute(sql).fetchall()[0]
+
+    def _write(self, callback):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE cache_state SET seq = seq + 1')
+            seq, = self._one('SELECT seq FROM cache_state')
+            result = callback(connection, seq)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._local.writes += 1
+        if self._local.writes % 100 == 0:
+            self._cull()
+        return result
+
+    def _store(self, connection, seq, key, value, timeout):
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, self.pickle_protocol),
+             self.get_backend_timeout(timeout), seq),
+        )
+
+    def _expiring_rows(self, keys):
+        """{ключ: (значение, срок по time.time() или None)}."""
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connection.execute(
+            f'SELECT key, value, expires FROM cache_entries WHERE key IN '
+            f'({placeholders}) AND value IS NOT NULL '
+            f'AND (expires IS NULL OR expires > ?)',
+            (*keys, time.time()),
+        )
+        return {key: (pickle.loads(value), expires)
+                for key, value, expires in rows}
+
+    def _live_rows(self, keys):
+        return {key: value
+                for key, (value, _) in self._expiring_rows(keys).items()}
+
+    def _cull(self):
+        connection = self._connection
+        connection.execute(
+            'DELETE FROM cache_entries WHERE expires IS NOT NULL '
+            'AND expires <= ?', (time.time(),))
+        count, = self._one('SELECT COUNT(*) FROM cache_entries')
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY seq LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def add(connection, seq):
+            if self._live_rows([key]):
+                return False
+            self._store(connection, seq, key, value, timeout)
+            return True
+        return self._write(add)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._live_rows([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        rows = self._live_rows(list(made))
+        return {made[key]: value for key, value in rows.items()}
+
+    def get_many_expiring(self, keys, version=None):
+        """Как get_many, но к значению добавляет срок жизни записи."""
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        rows = self._expiring_rows(list(made))
+        return {made[key]: row for key, row in rows.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(lambda connection, seq: self._store(
+            connection, seq, key, value, timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_key(key, version=version): value
+                for key, value in data.items()}
+        for key in made:
+            self.validate_key(key)
+
+        def store(connection, seq):
+            for key, value in made.items():
+                self._store(connection, seq, key, value, timeout)
+        self._write(store)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._write(lambda connection, seq: connection.execute(
+            'UPDATE cache_entries SET expires = ?, seq = ? '
+            'WHERE key = ? AND value IS NOT NULL',
+            (self.get_backend_timeout(timeout), seq, key),
+        ).rowcount))
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+
+        expires = time.time() + self.tombstone_timeout
+
+        def bury(connection, seq):
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_entries VALUES (?, NULL, ?, ?)',
+                [(key, expires, seq) for key in made],
+            )
+        self._write(bury)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def incr(connection, seq):
+            rows = self._live_rows([key])
+            if key not in rows:
+                raise ValueError("Key '%s' not found" % key)
+            value = rows[key] + delta
+            connection.execute(
+                'UPDATE cache_entries SET value = ?, seq = ? WHERE key = ?',
+                (pickle.dumps(value, self.pickle_protocol), seq, key))
+            return value
+        return self._write(incr)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def clear(self):
+        def clear(connection, seq):
+            connection.execute('DELETE FROM cache_entries')
+            connection.execute('UPDATE cache_state SET flush_seq = ?', (seq,))
+        self._write(clear)
+
+    def changes_since(self, seq):
+        """Номер последнего изменения и ключи, изменённые после seq.
+
+        Вместо списка ключей возвращает None, если кеш с тех пор
+        очищали целиком.
+        """
+        current, flush_seq = self._one(
+            'SELECT seq, flush_seq FROM cache_state')
+        if flush_seq > seq or current < seq:
+            return current, None
+        rows = self._connection.execute(
+            'SELECT key FROM cache_entries WHERE seq > ?', (seq,))
+        return current, [key for key, in rows]
+
+
+class SharedCacheAdapter:
+    """Обёртка над кешем из CACHES (memcached, redis) с журналом изменений.
+
+    Каждое изменение увеличивает счётчик и записывает изменённый ключ
+    под его номером; отстающий процесс, чей номер уже выпал из журнала,
+    очищает свой L1 целиком. Срок жизни записи бэкенды Django наружу
+    не отдают, поэтому он лежит рядом, в отдельном ключе.
+    """
+    seq_key = 'tiered:seq'
+    max_changes: int = 1000
+
+    def __init__(self, alias, log_timeout=300):
+        self.alias = alias
+        self.log_timeout = log_timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _change_key(self, seq):
+        return f'tiered:change:{seq}'
+
+    def _expires_key(self, key):
+        return f'tiered:expires:{key}'
+
+    def _expires(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.cache.default_timeout
+        return None if timeout is None else time.time() + timeout
+
+    def _log(self, keys):
+        for key in keys:
+            try:
+                seq = self.cache.incr(self.seq_key)
+            except ValueError:
+                self.cache.add(self.seq_key, 0, None)
+                seq = self.cache.incr(self.seq_key)
+            self.cache.set(self._change_key(seq), key, self.log_timeout)
+
+    def add(self, key, value, timeout):
+        added = self.cache.add(key, value, timeout)
+        if added:
+            self.cache.set(self._expires_key(key), self._expires(timeout),
+                           timeout)
+            self._log([key])
+        return added
+
+    def get_many_expiring(self, keys):
+        found = self.cache.get_many(
+            [*keys, *(self._expires_key(key) for key in keys)])
+        return {key: (found[key], found.get(self._expires_key(key)))
+                for key in keys if key in found}
+
+    def set(self, key, value, timeout):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout):
+        expires = self._expires(timeout)
+        failed = self.cache.set_many({**data, **{
+            self._expires_key(key): expires for key in data}}, timeout)
+        self._log(data)
+        return failed
+
+    def touch(self, key, timeout):
+        touched = self.cache.touch(key, timeout)
+        if touched:
+            self.cache.set(self._expires_key(key), self._expires(timeout),
+                           timeout)
+        return touched
+
+    def delete_many(self, keys):
+        self.cache.delete_many(
+            [*keys, *(self._expires_key(key) for key in keys)])
+        self._log(keys)
+
+    def incr(self, key, delta):
+        value = self.cache.incr(key, delta)
+        self._log([key])
+        return value
+
+    def clear(self):
+        self.cache.clear()
+
+    def changes_since(self, seq):
+        current = self.cache.get(self.seq_key, 0)
+        if current < seq or current - seq > self.max_changes:
+            return current, None
+        wanted = [self._change_key(number)
+                  for number in range(seq + 1, current + 1)]
+        found = self.cache.get_many(wanted)
+        if len(found) < len(wanted):
+            return current, None
+        return current, list(found.values())
+
+
+class _L1Store:
+    """LRU-словарь процесса с маркерами срока жизни и номером синхронизации."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.seq = None
+        self.synced_at = 0.0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _missing
+            pickled, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return _missing
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def put(self, key, value, ttl):
+        if ttl is not None and ttl <= 0:
+            self.evict([key])
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (pickled, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def evict(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache(BaseCache):
+    """Бэкенд кеша: L1 в памяти процесса, L2 общий для всех воркеров.
+
+    OPTIONS:
+        L2 — алиас кеша из CACHES для общего уровня; без него L2 —
+             файл SQLite по пути LOCATION;
+        L1_MAX_ENTRIES — размер LRU в процессе;
+        L1_TIMEOUT — сколько секунд копия живёт в L1;
+        SYNC_INTERVAL — как часто забирать изменения из L2.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1.0)
+        if options.get('L2'):
+            self._l2 = SharedCacheAdapter(
+                options['L2'], options.get('LOG_TIMEOUT', 300))
+        else:
+            # Ключи уже собраны make_key этого бэкенда. Надгробие должно
+            # пережить копию в L1 процесса, который ещё не синхронизировался.
+            self._l2 = SQLiteCache(location, {
+                **params, 'KEY_FUNCTION': lambda key, *args: key,
+                'OPTIONS': {**options, 'TOMBSTONE_TIMEOUT': (
+                    self.l1_timeout + self.sync_interval)}})
+        name = options.get('L1_NAME', location or options.get('L2'))
+        with _l1_stores_lock:
+            self._l1 = _l1_stores.setdefault(
+                name, _L1Store(options.get('L1_MAX_ENTRIES', 1000)))
+
+    def _ttl(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _copy_ttl(self, expires):
+        """Срок копии в L1: не дольше l1_timeout и остатка жизни в L2."""
+        if expires is None:
+            return self.l1_timeout
+        return min(self.l1_timeout, expires - time.time())
+
+    def _sync(self):
+        l1 = self._l1
+        now = time.monotonic()
+        if l1.seq is not None and now - l1.synced_at < self.sync_interval:
+            return
+        seq, keys = self._l2.changes_since(l1.seq or 0)
+        if l1.seq is not None:
+            if keys is None:
+                l1.clear()
+            else:
+                l1.evict(keys)
+        l1.seq, l1.synced_at = seq, now
+
+    def _made(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._made(key, version)
+        added = self._l2.add(key, value, timeout)
+        if added:
+            self._l1.put(key, value, self._ttl(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._made(key, version)
+        self._sync()
+        value = self._l1.get(key)
+        if value is not _missing:
+            return value
+        found = self._l2.get_many_expiring([key])
+        if key not in found:
+            return default
+        value, expires = found[key]
+        self._l1.put(key, value, self._copy_ttl(expires))
+        return value
+
+    def get_many(self, keys, version=None):
+        made = {self._made(key, version): key for key in keys}
+        self._sync()
+        found, missing = {}, []
+        for key in made:
+            value = self._l1.get(key)
+            if value is _missing:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self._l2.get_many_expiring(missing)
+            for key, (value, expires) in fetched.items():
+                self._l1.put(key, value, self._copy_ttl(expires))
+                found[key] = value
+        return {made[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._made(key, version)
+        self._l2.set(key, value, timeout)
+        self._l1.put(key, value, self._ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self._made(key, version): value
+                for key, value in data.items()}
+        self._l2.set_many(made, timeout)
+        for key, value in made.items():
+            self._l1.put(key, value, self._ttl(timeout))
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._made(key, version)
+        self._l1.evict([key])
+        return self._l2.touch(key, timeout)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        made = [self._made(key, version) for key in keys]
+        self._l2.delete_many(made)
+        self._l1.evict(made)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._made(key, version)
+        value = self._l2.incr(key, delta)
+        self._l1.evict([key])
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def clear(self):
+        self._l2.clear()
+        self._l1.clear()
@@ -0,0 +1,38 @@
+"""Настройка соединений SQLite под одновременные запись и чтение.
+
+Каждое новое соединение получает прагмы из sqlite_pragmas (их можно
+переопределить в SQLITE_PRAGMAS):
+
+* WAL — читатели не ждут писателя, а писатель не ждёт читателей;
+* synchronous=NORMAL — в WAL база не портится при падении процесса,
+  а fsync идёт только на контрольной точке;
+* busy_timeout — занятая база ждёт, а не падает с database is locked;
+* cache_size, mmap_size и temp_store — страницы и временные таблицы
+  держатся в памяти.
+
+Соединения живут CONN_MAX_AGE секунд, так что прагмы не выполняются
+на каждый запрос. Обслуживание файла — команда db_maintenance.
+"""
+from django.conf import settings
+
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def pragmas():
+    return {**sqlite_pragmas, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: выставляет прагмы SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas().items():
+            cursor.execute(f'PRAGMA {name}={value}')
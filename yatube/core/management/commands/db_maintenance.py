@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+auto_vacuum_incremental = 2
+
+
+class Command(BaseCommand):
+    help = ('Обслуживает файл SQLite: обновляет статистику планировщика '
+            '(ANALYZE), возвращает свободные страницы (incremental VACUUM) '
+            'и переносит WAL в базу с усечением журнала. Печатает время '
+            'каждого шага.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--pages', type=int, default=0,
+                            help='сколько страниц вернуть; 0 — все')
+        parser.add_argument('--full', action='store_true',
+                            help='включить auto_vacuum=INCREMENTAL полным '
+                                 'VACUUM, если он ещё не включён')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite')
+        self.cursor = connection.cursor()
+        try:
+            self.step('ANALYZE', self.analyze)
+            self.step('VACUUM', lambda: self.vacuum(options['pages'],
+                                                    options['full']))
+            self.step('Контрольная точка WAL', self.checkpoint)
+        finally:
+            self.cursor.close()
+
+    def step(self, title, action):
+        started = time.monotonic()
+        result = action()
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{title}: {elapsed:.3f} с, {result}')
+
+    def pragma(self, sql):
+        self.cursor.execute(f'PRAGMA {sql}')
+        return self.cursor.fetchone()
+
+    def analyze(self):
+        self.cursor.execute('ANALYZE')
+        return 'статистика обновлена'
+
+    def vacuum(self, pages, full):
+        """Возвращает свободные страницы файла.
+
+        incremental_vacuum работает, только если auto_vacuum=INCREMENTAL;
+        включить его у готовой базы можно лишь полным VACUUM, который
+        переписывает весь файл, — поэтому только по --full.
+        """
+        free_before, = self.pragma('freelist_count')
+        mode, = self.pragma('auto_vacuum')
+        if mode != auto_vacuum_incremental:
+            if not full:
+                return ('пропущено: auto_vacuum не INCREMENTAL, '
+                        'запустите с --full')
+            self.pragma('auto_vacuum=INCREMENTAL')
+            self.cursor.execute('VACUUM')
+        else:
+            self.cursor.execute(f'PRAGMA incremental_vacuum({pages})')
+            self.cursor.fetchall()
+        free_after, = self.pragma('freelist_count')
+        return f'освобождено страниц: {free_before - free_after}'
+
+    def checkpoint(self):
+        busy, log, done = self.pragma('wal_checkpoint(TRUNCATE)')
+        if log < 0:
+            return 'база не в режиме WAL'
+        state = 'журнал занят читателями' if busy else 'журнал усечён'
+        return f'перенесено страниц: {done} из {log}, {state}'
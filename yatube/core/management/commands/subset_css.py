@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import os
+import re
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.utils import get_app_template_dirs
+
+bootstrap_url = ('https://cdn.jsdelivr.net/npm/bootstrap@5.0.2/dist/css/'
+                 'bootstrap.min.css')
+bootstrap_integrity = ('sha384-EVSTQN3/azprG1Anm3QDgpJLIm9Nao0Yz1ztcQTwFspd'
+                       '3yD65VohhpuuCOmLASjC')
+# Классы, которые ставит bootstrap.bundle.js, а не шаблоны.
+script_classes = ('active', 'collapse', 'collapsed', 'collapsing', 'fade',
+                  'show', 'showing', 'hiding', 'disabled')
+nesting_rules = ('@media', '@supports', '@document')
+
+comment_re = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+class_attr_re = re.compile(r'class\s*=\s*("[^"]*"|\'[^\']*\')')
+addclass_re = re.compile(r'addclass:\s*("[^"]*"|\'[^\']*\')')
+template_tag_re = re.compile(r'{%.*?%}|{{.*?}}', re.S)
+selector_class_re = re.compile(r'\.((?:\\.|[\w-])+)')
+not_re = re.compile(r':not\([^()]*\)')
+# Строки совпадают целиком, поэтому скобки внутри них не считаются.
+structure_re = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[{};]')
+
+
+def used_classes(directories):
+    """Классы из атрибутов class и фильтров addclass в шаблонах."""
+    found = set(script_classes)
+    for directory in directories:
+        for path, _, names in os.walk(directory):
+            for name in names:
+                if not name.endswith(('.html', '.txt')):
+                    continue
+                with open(os.path.join(path, name), encoding='utf-8') as file:
+                    text = file.read()
+                values = (class_attr_re.findall(text)
+                          + addclass_re.findall(text))
+                for value in values:
+                    # Из {% if %}active{% endif %} остаётся active.
+                    found.update(template_tag_re.sub(' ', value[1:-1])
+                                 .split())
+    return found
+
+
+def parse_rules(css):
+    """Пары (заголовок, тело) правил верхнего уровня.
+
+    У операторов вроде @charset и @import тела нет — None.
+    """
+    rules, depth, start, prelude_end = [], 0, 0, 0
+    for match in structure_re.finditer(css):
+        char, index = match.group(), match.start()
+        if char == '{':
+            if depth == 0:
+                prelude_end = index
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((css[start:prelude_end].strip(),
+                              css[prelude_end + 1:index]))
+                start = index + 1
+        elif char == ';' and depth == 0:
+            rules.append((css[start:index].strip(), None))
+            start = index + 1
+    return rules
+
+
+def split_selectors(prelude):
+    selectors, depth, start = [], 0, 0
+    for index, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+    selectors.append(prelude[start:].strip())
+    return selectors
+
+
+def selector_used(selector, used):
+    """Селектор нужен, если все его классы встречаются в шаблонах.
+
+    Классы внутри :not() не считаются: их отсутствие не мешает
+    селектору сработать.
+    """
+    classes = selector_class_re.findall(not_re.sub('', selector))
+    return all(name.replace('\\', '') in used for name in classes)
+
+
+def subset(css, used):
+    """Оставляет правила, селекторы которых могут совпасть с разметкой."""
+    kept = []
+    for prelude, body in parse_rules(css):
+        if body is None:
+            kept.append(f'{prelude};')
+        elif prelude.lower().startswith(nesting_rules):
+            inner = subset(body, used)
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude}{{{body.strip()}}}')
+        else:
+            selectors = [selector for selector in split_selectors(prelude)
+                         if selector_used(selector, used)]
+            if selectors:
+                kept.append(f'{",".join(selectors)}{{{body.strip()}}}')
+    return ''.join(kept)
+
+
+def check_integrity(content, integrity):
+    algorithm, expected = integrity.split('-', 1)
+    digest = base64.b64encode(hashlib.new(algorithm, content).digest())
+    if digest.decode() != expected:
+        raise CommandError('Хеш таблицы стилей не совпал с --integrity')
+
+
+class Command(BaseCommand):
+    help = ('Урезает таблицу стилей Bootstrap до классов, которые есть '
+            'в шаблонах проекта, и кладёт её в static/css. Запускается '
+            'перед collectstatic.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=bootstrap_url,
+                            help='путь или URL полной таблицы стилей')
+        parser.add_argument('--integrity', default=None,
+                            help='SRI-хеш источника; для Bootstrap '
+                                 'по умолчанию известен')
+        parser.add_argument('--output', default=os.path.join(
+            settings.STATICFILES_DIRS[0], 'css', 'bootstrap.min.css'))
+        parser.add_argument('--keep', nargs='*', default=(),
+                            help='классы, которые нужно оставить')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        integrity = options['integrity']
+        if source.startswith(('http://', 'https://')):
+            with urlopen(source) as response:
+                content = response.read()
+            if integrity is None and source == bootstrap_url:
+                integrity = bootstrap_integrity
+        else:
+            with open(source, 'rb') as file:
+                content = file.read()
+        if integrity:
+            check_integrity(content, integrity)
+        directories = [
+            directory for directory in (
+                *settings.TEMPLATES[0]['DIRS'],
+                *get_app_template_dirs('templates'))
+            if directory.startswith(settings.BASE_DIR)
+        ]
+        used = used_classes(directories) | set(options['keep'])
+        css = comment_re.sub(lambda match: match.group(1) or '',
+                             content.decode('utf-8'))
+        result = subset(css, used)
+        os.makedirs(os.path.dirname(options['output']), exist_ok=True)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            file.write(result)
+        self.stdout.write(f'Таблица стилей: {len(content)} → '
+                          f'{len(result.encode())} байт, '
+                          f'классов в шаблонах: {len(used)}')
@@ -0,0 +1,29 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import replicas
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик из '
+            'DATABASE_REPLICAS через backup API: читатели реплики видят '
+            'либо старую, либо новую копию целиком. Запускается по '
+            'расписанию; интервал — допустимое отставание реплик.')
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite')
+        source.ensure_connection()
+        for alias in replicas():
+            started = time.monotonic()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{alias}: {elapsed:.3f} с')
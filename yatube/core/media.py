@@ -0,0 +1,227 @@
+"""Раздача файлов из MEDIA_ROOT для боевого режима.
+
+Целый файл отдаётся FileResponse: под WSGI-сервером с wsgi.file_wrapper
+(gunicorn, uWSGI) это sendfile. Поддерживаются одиночные диапазоны
+Range/If-Range и условные запросы: ETag — хеш содержимого, для имён
+по хешу (posts/ab/cd/….jpg) он берётся из имени, для остальных
+считается один раз и живёт в кеше до смены mtime или размера. Имена
+по хешу не меняют содержимого и кешируются браузером на год.
+
+Если задан MEDIA_ACCEL_REDIRECT, Django только проверяет файл и
+заголовки, а тело отдаёт прокси по X-Accel-Redirect.
+
+serve_static так же отдаёт собранную статику, выбирая по
+Accept-Encoding копию .br или .gz из core.storage.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+immutable_max_age: int = 60 * 60 * 24 * 365
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+hashed_static_re = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+static_encodings = (('.br', 'br'), ('.gz', 'gzip'))
+content_name_re = re.compile(
+    r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.\w+)?$')
+
+
+def max_age():
+    return getattr(settings, 'MEDIA_MAX_AGE', 60 * 60)
+
+
+def accel_redirect():
+    return getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+
+
+class RangeFile:
+    """Читает из файла не больше length байт, начиная с offset.
+
+    Атрибута name нет намеренно: иначе FileResponse поставил бы
+    Content-Length всего файла.
+    """
+
+    def __init__(self, file, offset, length):
+        file.seek(offset)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def content_etag(path, name, stat_result):
+    """ETag из хеша содержимого: из имени файла или посчитанный заранее."""
+    match = content_name_re.search(name)
+    if match:
+        return quote_etag(match.group('digest'))
+    key = f'media_etag:{name}:{stat_result.st_mtime_ns}:{stat_result.st_size}'
+    etag = cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(64 * 1024), b''):
+                digest.update(chunk)
+        etag = quote_etag(digest.hexdigest())
+        cache.set(key, etag, None)
+    return etag
+
+
+def parse_range(header, size):
+    """(начало, конец) одиночного диапазона Range включительно.
+
+    None — заголовка нет или он не из поддерживаемых (несколько
+    диапазонов); тогда отдаётся весь файл. ValueError — диапазон
+    за пределами файла.
+    """
+    match = range_re.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(0, size - int(end)), size - 1
+    elif not end:
+        start, end = int(start), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1)
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def if_range_passes(request, etag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def set_cache_headers(response, etag, last_modified, immutable):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if immutable:
+        response['Cache-Control'] = (f'public, max-age={immutable_max_age}, '
+                                     f'immutable')
+    else:
+        response['Cache-Control'] = f'public, max-age={max_age()}'
+    return response
+
+
+def find_file(root, path):
+    """Полный путь и stat обычного файла root/path; иначе Http404."""
+    if not root:
+        raise Http404
+    try:
+        full_path = safe_join(root, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+    return full_path, stat_result
+
+
+def file_response(request, full_path, stat_result, etag, immutable,
+                  content_type, accel_path=None, ranges=True):
+    """Ответ на GET/HEAD файла: 304, 206, 416 или весь файл."""
+    size = stat_result.st_size
+    last_modified = int(stat_result.st_mtime)
+    not_modified = get_conditional_response(request, etag, last_modified)
+    if not_modified is not None:
+        return set_cache_headers(not_modified, etag, last_modified,
+                                 immutable)
+
+    byte_range = None
+    if ranges and if_range_passes(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE', ''),
+                                     size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if accel_path:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_path
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(open(full_path, 'rb'), start, end - start + 1),
+            status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if ranges:
+        response['Accept-Ranges'] = 'bytes'
+    return set_cache_headers(response, etag, last_modified, immutable)
+
+
+def guess_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+@require_safe
+def serve(request, path):
+    """Отдаёт файл MEDIA_ROOT/path с поддержкой Range и 304."""
+    full_path, stat_result = find_file(settings.MEDIA_ROOT, path)
+    accel = accel_redirect()
+    return file_response(
+        request, full_path, stat_result,
+        etag=content_etag(full_path, path, stat_result),
+        immutable=bool(content_name_re.search(path)),
+        content_type=guess_type(path),
+        accel_path=accel + quote(path) if accel else None)
+
+
+@require_safe
+def serve_static(request, path):
+    """Отдаёт собранную статику из STATIC_ROOT.
+
+    Если клиент принимает br или gzip и collectstatic записал сжатую
+    копию, отдаётся она. Имена с отпечатком кешируются навсегда.
+    """
+    full_path, stat_result = find_file(settings.STATIC_ROOT, path)
+    name, encoding = path, None
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for suffix, coding in static_encodings:
+        if not re.search(rf'\b{coding}\b', accepted):
+            continue
+        try:
+            full_path, stat_result = find_file(settings.STATIC_ROOT,
+                                               path + suffix)
+        except Http404:
+            continue
+        name, encoding = path + suffix, coding
+        break
+    response = file_response(
+        request, full_path, stat_result,
+        etag=content_etag(full_path, name, stat_result),
+        immutable=bool(hashed_static_re.search(path)),
+        content_type=guess_type(path), ranges=encoding is None)
+    if encoding and response.status_code == 200:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,55 @@
+import logging
+
+from .queries import QueryBudgetExceeded, QueryCounter, budget_action
+from .routers import pin_seconds, reset, wrote
+
+logger = logging.getLogger(__name__)
+
+pin_cookie = 'primary_pin'
+
+
+class PrimaryPinMiddleware:
+    """Читает с основной базы, пока не истекла cookie после записи.
+
+    Стоит первой в MIDDLEWARE, чтобы заметить и записи других
+    middleware, например сохранение сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset(pinned=pin_cookie in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if wrote():
+                response.set_cookie(pin_cookie, '1', max_age=pin_seconds(),
+                                    httponly=True, samesite='Lax')
+        finally:
+            reset()
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Проверяет бюджет запросов вьюхи и ищет N+1 (см. core.queries).
+
+    Стоит сразу после PrimaryPinMiddleware, чтобы считать и запросы
+    сессии и пользователя.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with counter.capture():
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        problems = counter.problems(budget)
+        if problems:
+            message = f'{request.path}: {"; ".join(problems)}'
+            if budget_action() == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,76 @@
+"""Бюджеты SQL-запросов и поиск N+1.
+
+Вьюха объявляет декоратором query_budget, сколько запросов ей можно
+сделать за один HTTP-запрос вместе с сессией и пользователем.
+core.middleware.QueryBudgetMiddleware считает запросы во всех базах
+и при превышении пишет предупреждение в лог, а с
+QUERY_BUDGET_ACTION = 'raise' бросает QueryBudgetExceeded. Запросы
+группируются по форме — SQL без параметров: форма, повторённая больше
+N_PLUS_ONE_THRESHOLD раз, почти всегда означает запрос в цикле.
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+in_list_re = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def budget_action():
+    return getattr(settings, 'QUERY_BUDGET_ACTION', 'log')
+
+
+def repeat_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+
+def query_budget(limit):
+    """Декоратор: вьюхе можно не больше limit запросов."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def query_shape(sql):
+    """SQL без параметров; списки IN (...) любой длины совпадают."""
+    return in_list_re.sub('IN (...)', sql)
+
+
+class QueryCounter:
+    """Обёртка execute для всех соединений: считает запросы и их формы."""
+
+    def __init__(self):
+        self.total = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        self.shapes[query_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def capture(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def repeated(self):
+        """Пары (форма, сколько раз) для форм сверх порога."""
+        threshold = repeat_threshold()
+        return [(shape, times) for shape, times in self.shapes.most_common()
+                if times > threshold]
+
+    def problems(self, budget):
+        found = []
+        if budget is not None and self.total > budget:
+            found.append(f'{self.total} запросов при бюджете {budget}')
+        found.extend(f'{times} раз: {shape}'
+                     for shape, times in self.repeated())
+        return found
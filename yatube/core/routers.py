@@ -0,0 +1,98 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в DATABASE_REPLICAS — алиасы из DATABASES; пустой
+список — всё идёт в default. Локально реплики — копии файла SQLite,
+которые обновляет команда sync_replicas.
+
+Реплика отстаёт, поэтому пользователь, который только что что-то
+записал, читает с основной базы REPLICA_PIN_SECONDS секунд: запись
+ставит флаг текущего запроса, а core.middleware.PrimaryPinMiddleware
+переносит его в cookie. Внутри транзакции чтение тоже идёт в default,
+иначе транзакция не увидела бы своих же записей.
+
+Страницы, которые кеш хранит до смены поколения, собираются внутри
+primary_reads: копия с отстающей реплики осталась бы в кеше до
+следующей смены.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+# Устаревшая сессия с реплики разлогинивает пользователя и стирает
+# его cookie, поэтому сессии всегда читаются из основной базы.
+primary_apps = ('sessions',)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 15)
+
+
+def pin_primary():
+    """Направляет чтение текущего потока в основную базу."""
+    _state.pinned = True
+
+
+@contextmanager
+def primary_reads():
+    """Чтение внутри блока идёт в основную базу."""
+    pinned = is_pinned()
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = pinned or wrote()
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def wrote():
+    """Писал ли текущий поток в базу с последнего reset."""
+    return getattr(_state, 'wrote', False)
+
+
+def record_write():
+    """Отмечает запись: до конца запроса поток читает из основной базы."""
+    _state.wrote = True
+    pin_primary()
+
+
+def reset(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if (not aliases or is_pinned()
+                or model._meta.app_label in primary_apps
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        record_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит вместе с копией базы.
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,83 @@
+"""Статика с отпечатками в именах и заранее сжатыми копиями.
+
+collectstatic, как ManifestStaticFilesStorage, кладёт рядом с файлом
+копию с хешем содержимого в имени и записывает соответствие в
+staticfiles.json. Затем текстовые файлы с отпечатком сжимаются
+в .gz и .br; без пакета brotli из requirements.txt пишется только .gz.
+Копия сохраняется, только если она меньше исходника. Отдаёт их
+core.media.serve_static или прокси (gzip_static/brotli_static в nginx).
+"""
+import gzip
+import io
+
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                StaticFilesStorage)
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compressible_extensions = ('.css', '.js', '.svg', '.txt', '.json', '.xml',
+                           '.map', '.ico', '.html')
+min_compress_size: int = 256
+
+
+def gzip_compress(content):
+    # mtime=0: одинаковый вход даёт одинаковый .gz при каждой сборке.
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+def compressors():
+    """Пары (суффикс, функция сжатия) для доступных кодировок."""
+    found = [('.gz', gzip_compress)]
+    if brotli is not None:
+        found.append(('.br', lambda content: brotli.compress(
+            content, quality=11)))
+    return found
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Без collectstatic (тесты, разработка) файлы идут под обычными
+    # именами, а не падают с ValueError.
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(hashed):
+            if name.endswith(compressible_extensions):
+                for compressed in self.compress(name):
+                    yield compressed, compressed, True
+
+    def compress(self, name):
+        """Пишет сжатые копии файла; отдаёт имена записанных."""
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < min_compress_size:
+            return
+        for suffix, compress in compressors():
+            data = compress(content)
+            if len(data) >= len(content):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+            yield name + suffix
@@ -0,0 +1,25 @@
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from core.management.commands.subset_css import (bootstrap_integrity,
+                                                 bootstrap_url)
+
+register = template.Library()
+bootstrap_subset = 'css/bootstrap.min.css'
+
+
+@register.simple_tag
+def bootstrap_stylesheet():
+    """Урезанный Bootstrap из subset_css, а без него — полный с CDN.
+
+    Файл в .gitignore: в свежем клоне и в CI его нет, пока не запущен
+    subset_css, и страницы иначе остались бы без стилей.
+    """
+    if finders.find(bootstrap_subset):
+        return format_html('<link rel="stylesheet" href="{}">',
+                           static(bootstrap_subset))
+    return format_html(
+        '<link rel="stylesheet" href="{}" integrity="{}" '
+        'crossorigin="anonymous">', bootstrap_url, bootstrap_integrity)
@@ -1,5 +1,31 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import time
 from http import HTTPStatus
-from django.test import TestCase
+from io import StringIO
+
+import brotli
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.template import Context, Template
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import ResolverMatch
+from django.utils.http import http_date
+from posts.models import Post
+
+from .caches import TieredCache
+from .db import sqlite_pragmas
+from .middleware import QueryBudgetMiddleware, pin_cookie
+from .queries import QueryBudgetExceeded, QueryCounter, query_budget
+from .routers import ReplicaRouter, reset
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +34,427 @@ class ViewTestClass(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         template = 'core/404.html'
         self.assertTemplateUsed(response, template)
+
+
+class TieredCacheTest(SimpleTestCase):
+    """Два процесса с общим L2 в SQLite и своими L1."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        location = os.path.join(directory, 'cache.sqlite3')
+        self.first = self.make_cache(location, 'first')
+        self.second = self.make_cache(location, 'second')
+
+    def make_cache(self, location, name):
+        return TieredCache(location, {'OPTIONS': {
+            'L1_NAME': f'{name}:{location}', 'SYNC_INTERVAL': 0,
+        }})
+
+    def test_basic_operations(self):
+        """Кеш поддерживает операции, которыми пользуется сайт."""
+        cache = self.first
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.incr('key'), 2)
+        cache.set_many({'a': 'x', 'b': 'y'}, None)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']),
+                         {'a': 'x', 'b': 'y'})
+        cache.delete_many(['a'])
+        self.assertIsNone(cache.get('a'))
+        cache.set('short', 1, 0)
+        self.assertIsNone(cache.get('short'))
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_writes_reach_other_process(self):
+        """Запись в одном процессе вытесняет старую копию из L1 другого."""
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_delete_survives_cull(self):
+        """Надгробие переживает отсечение и доходит до отставшего L1."""
+        self.first.set('pending', True)
+        self.assertTrue(self.second.get('pending'))
+        self.first.delete('pending')
+        self.first._l2._cull()
+        self.assertIsNone(self.second.get('pending'))
+
+    def test_clear_reaches_other_process(self):
+        """Очистка кеша сбрасывает L1 всех процессов."""
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_l1_returns_copies(self):
+        """Изменение полученного объекта не портит копию в L1."""
+        self.first.set('key', {'value': 1})
+        self.first.get('key')['value'] = 2
+        self.assertEqual(self.first.get('key'), {'value': 1})
+
+    def test_l1_copy_expires_with_l2(self):
+        """Копия в L1 живёт не дольше записи в L2."""
+        self.first.set('short', 'value', 0.2)
+        self.first.set('long', 'value', 60)
+        self.assertEqual(self.second.get_many(['short', 'long']),
+                         {'short': 'value', 'long': 'value'})
+        time.sleep(0.3)
+        self.assertIsNone(self.second.get('short'))
+        self.assertEqual(self.second.get('long'), 'value')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.'
+                               'LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.'
+                              'LocMemCache', 'LOCATION': 'tiered-shared'},
+    })
+    def test_shared_l2_keeps_expiry(self):
+        """С L2 из CACHES срок записи тоже доходит до L1."""
+        first, second = (TieredCache('', {'OPTIONS': {
+            'L2': 'shared', 'L1_NAME': f'{name}:shared', 'SYNC_INTERVAL': 0,
+        }}) for name in ('first', 'second'))
+        first.set('short', 'value', 0.2)
+        self.assertEqual(second.get('short'), 'value')
+        time.sleep(0.3)
+        self.assertIsNone(second.get('short'))
+        self.assertIsNone(first.get('added'))
+        self.assertTrue(first.add('added', 1, 60))
+        self.assertEqual(second.incr('added'), 2)
+        self.assertEqual(first.get('added'), 2)
+
+
+class MediaServeTest(SimpleTestCase):
+    content = b'0123456789'
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        self.hashed = (f'posts/{self.digest[:2]}/{self.digest[2:4]}/'
+                       f'{self.digest}.txt')
+        for name in ('cache/plain.txt', self.hashed):
+            path = os.path.join(root, name)
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as file:
+                file.write(self.content)
+        self.modified = http_date(os.stat(path).st_mtime)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def test_full_file(self):
+        """Файл отдаётся целиком с ETag из хеша содержимого."""
+        for name, cache_control in (
+                ('cache/plain.txt', 'public, max-age=3600'),
+                (self.hashed, 'public, max-age=31536000, immutable')):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.content)
+                self.assertEqual(response['ETag'], f'"{self.digest}"')
+                self.assertEqual(response['Cache-Control'], cache_control)
+                self.assertEqual(response['Content-Length'], '10')
+
+    def test_not_modified(self):
+        """Совпавший ETag или дата дают 304 без тела."""
+        for headers in ({'HTTP_IF_NONE_MATCH': f'"{self.digest}"'},
+                        {'HTTP_IF_MODIFIED_SINCE': self.modified}):
+            with self.subTest(headers=headers):
+                response = self.get('cache/plain.txt', **headers)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response['ETag'], f'"{self.digest}"')
+
+    def test_ranges(self):
+        """Одиночные диапазоны отдаются с 206, лишние — с 416."""
+        cases = (
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        )
+        for header, body, content_range in cases:
+            with self.subTest(header=header):
+                response = self.get(self.hashed, HTTP_RANGE=header)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+        response = self.get(self.hashed, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        response = self.get(self.hashed, HTTP_RANGE='bytes=2-5',
+                            HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_missing_and_outside_files(self):
+        """Чужие пути и каталоги дают 404."""
+        for name in ('cache/absent.txt', '../settings.py', 'cache/'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code,
+                                 HTTPStatus.NOT_FOUND)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        """С MEDIA_ACCEL_REDIRECT тело отдаёт прокси."""
+        response = self.get('cache/plain.txt')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/cache/plain.txt')
+        self.assertEqual(response.content, b'')
+
+
+class StaticPipelineTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.source = os.path.join(root, 'source')
+        os.makedirs(os.path.join(self.source, 'css'))
+        settings = override_settings(
+            STATICFILES_DIRS=(self.source,),
+            STATIC_ROOT=os.path.join(root, 'collected'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_subset_css(self):
+        """В урезанном Bootstrap остаются только классы из шаблонов."""
+        source = self.write('full.css', (
+            '/* комментарий */:root{--bs-blue:#0d6efd}'
+            '.card,.unused{padding:1rem}.unused-too{color:red}'
+            'a:not(.unused){color:blue}'
+            '@media (min-width:768px){.col-md-8{width:66%}.nope{top:0}}'
+            '@media print{.nope{top:0}}'
+            '@keyframes spin{to{transform:rotate(360deg)}}'
+        ))
+        output = os.path.join(self.source, 'css', 'bootstrap.min.css')
+        call_command('subset_css', source=source, output=output,
+                     stdout=StringIO())
+        with open(output) as file:
+            self.assertEqual(file.read(), (
+                ':root{--bs-blue:#0d6efd}.card{padding:1rem}'
+                'a:not(.unused){color:blue}'
+                '@media (min-width:768px){.col-md-8{width:66%}}'
+                '@keyframes spin{to{transform:rotate(360deg)}}'
+            ))
+        with self.assertRaises(CommandError):
+            call_command('subset_css', source=source, output=output,
+                         integrity='sha384-AAAA', stdout=StringIO())
+
+    def test_collected_files_are_compressed(self):
+        """collectstatic пишет сжатые копии, их отдают по Accept-Encoding."""
+        content = '.card{padding:1rem}\n' * 50
+        self.write('css/site.css', content)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = staticfiles_storage.url('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+
+        for encoding, decompress in (('br', brotli.decompress),
+                                     ('gzip', gzip.decompress)):
+            with self.subTest(encoding=encoding):
+                response = self.client.get(
+                    url, HTTP_ACCEPT_ENCODING=f'{encoding}, identity')
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertIn('immutable', response['Cache-Control'])
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertEqual(decompress(
+                    b''.join(response.streaming_content)).decode(), content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         content)
+
+    def test_bootstrap_falls_back_to_cdn(self):
+        """Без урезанного Bootstrap страница берёт полный с CDN."""
+        template = Template('{% load assets %}{% bootstrap_stylesheet %}')
+        self.assertIn('cdn.jsdelivr.net', template.render(Context()))
+        self.write('css/bootstrap.min.css', '.card{padding:1rem}')
+        self.assertIn('href="/static/css/bootstrap.min.css"',
+                      template.render(Context()))
+
+
+class SQLiteTuningTest(TransactionTestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        """Новое соединение получает прагмы из core.db."""
+        connection.close()
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'),
+                         sqlite_pragmas['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'),
+                         sqlite_pragmas['cache_size'])
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_maintenance_reports_steps(self):
+        """db_maintenance проходит все шаги и печатает их время."""
+        out = StringIO()
+        call_command('db_maintenance', stdout=out)
+        call_command('db_maintenance', full=True, stdout=out)
+        call_command('db_maintenance', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 9)
+        self.assertRegex(lines[0], r'^ANALYZE: \d+\.\d{3} с')
+        self.assertIn('запустите с --full', lines[1])
+        self.assertIn('освобождено страниц', lines[4])
+        self.assertIn('освобождено страниц', lines[7])
+        self.assertEqual(self.pragma('auto_vacuum'), 2)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        reset()
+        self.addCleanup(reset)
+        self.router = ReplicaRouter()
+
+    def test_reads_go_to_replica_until_write(self):
+        """Чтение идёт на реплику, после записи — в основную базу."""
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        reset()
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        reset(pinned=True)
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_sessions_read_primary(self):
+        """Сессии читаются из основной базы."""
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        """Схема реплик не мигрирует: она приходит с копией базы."""
+        self.assertIs(self.router.allow_migrate('replica', 'posts'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_is_primary(self):
+        """Без реплик всё читается из default."""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=30)
+class ReplicaStalenessTest(TransactionTestCase):
+    """Реплика — файл SQLite, который обновляет sync_replicas."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(directory, 'replica.sqlite3'),
+        }
+        connections.ensure_defaults('replica')
+        connections.prepare_test_settings('replica')
+        self.addCleanup(connections.databases.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(connections['replica'].close)
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username='author')
+        self.sync()
+
+    def sync(self):
+        call_command('sync_replicas', stdout=StringIO())
+
+    def test_inside_transaction_reads_primary(self):
+        """В транзакции чтение идёт в default."""
+        with transaction.atomic():
+            self.assertEqual(ReplicaRouter().db_for_read(Post), 'default')
+
+    def test_writer_reads_own_writes(self):
+        """Автор сразу видит свой пост, остальные — после синхронизации."""
+        writer = self.client_class()
+        writer.force_login(self.author)
+        response = writer.post('/create/', {'text': 'Свежий пост'})
+        self.assertIn(pin_cookie, response.cookies)
+        post = Post.objects.using('default').get(text='Свежий пост')
+        url = f'/posts/{post.pk}/'
+
+        self.assertEqual(writer.get(url).status_code, HTTPStatus.OK)
+        reader = self.client_class()
+        self.assertEqual(reader.get(url).status_code, HTTPStatus.NOT_FOUND)
+        self.sync()
+        self.assertEqual(reader.get(url).status_code, HTTPStatus.OK)
+        self.assertNotIn(pin_cookie, reader.cookies)
+
+    def test_cached_pages_render_from_primary(self):
+        """Страница для кеша собирается из основной базы, а не с реплики."""
+        reader = self.client_class()
+        reader.get('/')
+        Post.objects.create(author=self.author, text='Свежий пост')
+        reset()
+        self.assertContains(reader.get('/'), 'Свежий пост')
+
+
+class QueryBudgetTest(TestCase):
+    """Бюджет запросов и поиск одинаковых запросов в цикле."""
+
+    def setUp(self):
+        self.users = [get_user_model().objects.create_user(
+            username=f'user{number}') for number in range(6)]
+
+    def request(self, budget, ids):
+        """Запрос к вьюхе с бюджетом budget, читающей ids по одному."""
+        @query_budget(budget)
+        def view(request):
+            for pk in ids:
+                get_user_model().objects.get(pk=pk)
+            return 'ok'
+
+        request = RequestFactory().get('/')
+        request.resolver_match = ResolverMatch(view, (), {})
+        return QueryBudgetMiddleware(lambda request: view(request))(request)
+
+    def test_repeated_shape(self):
+        """Списки IN разной длины дают одну форму, get в цикле — N+1."""
+        counter = QueryCounter()
+        users = get_user_model().objects
+        with counter.capture():
+            list(users.filter(pk__in=[1]))
+            list(users.filter(pk__in=[1, 2, 3]))
+            for user in self.users:
+                users.get(pk=user.pk)
+        self.assertEqual(counter.total, 8)
+        self.assertEqual(len(counter.shapes), 2)
+        self.assertEqual([times for _, times in counter.repeated()], [6])
+
+    @override_settings(QUERY_BUDGET_ACTION='raise')
+    def test_raise(self):
+        self.assertEqual(self.request(2, [self.users[0].pk]), 'ok')
+        with self.assertRaisesMessage(QueryBudgetExceeded,
+                                      '3 запросов при бюджете 2'):
+            self.request(2, [user.pk for user in self.users[:3]])
+        with self.assertRaisesMessage(QueryBudgetExceeded, '6 раз'):
+            self.request(10, [user.pk for user in self.users])
+
+    def test_log(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.assertEqual(self.request(1, [user.pk for user in
+                                              self.users[:2]]), 'ok')
+        self.assertIn('2 запросов при бюджете 1', logs.output[0])
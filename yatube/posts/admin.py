@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Comment, Follow, Group, Post
+
+from .feeds import pull_threshold, push_threshold
+from .models import Comment, Follow, Group, Post, Profile
+from .search import filter_matching
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -26,6 +29,11 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk',
@@ -42,12 +50,40 @@ class FollowAdmin(admin.ModelAdmin):
         'pk',
         'user',
         'author',
+        'author_followers',
+        'delivery',
     )
+    list_select_related = ('user', 'author__profile')
+    list_filter = ('author__profile__pull_delivery',)
     search_fields = ('user', 'author')
     empty_value_display = '-пусто-'
 
+    def author_followers(self, obj):
+        return getattr(obj.author, 'profile', Profile()).followers_count
+    author_followers.short_description = 'Подписчиков у автора'
+
+    def delivery(self, obj):
+        profile = getattr(obj.author, 'profile', Profile())
+        return 'pull' if profile.pull_delivery else 'push'
+    delivery.short_description = (
+        f'Доставка (pull > {pull_threshold()}, push < {push_threshold()})'
+    )
+
+
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'followers_count',
+        'pull_delivery',
+        'delivery_pending',
+    )
+    list_filter = ('pull_delivery', 'delivery_pending')
+    search_fields = ('user__username',)
+    empty_value_display = '-пусто-'
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(Profile, ProfileAdmin)
@@ -0,0 +1,372 @@
+"""Кеш страниц с ключами по поколениям данных.
+
+У каждой области данных (главная, группа, профиль) есть поколение —
+случайный токен в кеше. Запись страницы хранит поколения областей,
+с которыми она собрана, поэтому лежит в кеше без срока и считается
+устаревшей сразу после того, как сигнал сменил токен.
+
+Устаревшая запись не выбрасывается: пока один запрос под короткой
+блокировкой в кеше пересобирает страницу, остальные получают старую
+версию (stale-while-revalidate), и промах не превращается в лавину
+одинаковых запросов к базе.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.routers import primary_reads
+
+from .models import Follow, Group, Post, User
+from .thumbnails import pending_names, prefetch_thumbnails
+
+page_timeout = None
+feed_timeout: int = 60 * 5
+feed_cached_pages: int = 3
+card_timeout: int = 60 * 60 * 24
+card_template = 'includes/article.html'
+cached_params = ('page', 'after', 'before')
+lock_timeout: int = 10
+wait_timeout: float = 2.0
+poll_interval: float = 0.05
+stats_events = ('hit', 'stale', 'miss')
+stats_flush_interval: float = 10.0
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+def feed_scope(user_id):
+    return f'feed:{user_id}'
+
+
+def user_scopes(obj, *fields):
+    """Области профилей из полей obj; удалённые каскадом пропускаются."""
+    scopes = []
+    for field in fields:
+        try:
+            scopes.append(profile_scope(getattr(obj, field).username))
+        except ObjectDoesNotExist:
+            pass
+    return scopes
+
+
+def post_scopes(post, group_ids=()):
+    """Области, в которых виден пост: главная, его группы и профиль."""
+    group_ids = {post.group_id, *group_ids} - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True) if group_ids else []
+    return [index_scope(), *user_scopes(post, 'author'),
+            *(group_scope(slug) for slug in slugs)]
+
+
+def group_scopes(group_id, slugs):
+    """Области, где видна группа: главная, её страницы и профили авторов."""
+    author_ids = set()
+    for posts in Post.objects.on_shards():
+        author_ids.update(posts.filter(group_id=group_id).order_by()
+                          .values_list('author_id', flat=True).distinct())
+    usernames = User.objects.filter(pk__in=author_ids).values_list(
+        'username', flat=True) if author_ids else []
+    return [index_scope(), *(group_scope(slug) for slug in slugs),
+            *(profile_scope(username) for username in usernames)]
+
+
+def author_scopes(author_id, usernames):
+    """Области, где видно имя автора: главная, профиль и его группы."""
+    group_ids = set(Post.objects.for_author(author_id).exclude(group=None)
+                    .order_by().values_list('group_id', flat=True)
+                    .distinct())
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True) if group_ids else []
+    return [index_scope(), *(profile_scope(name) for name in usernames),
+            *(group_scope(slug) for slug in slugs)]
+
+
+def _generation_key(scope):
+    return f'generation:{scope}'
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def get_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_generation(), None)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Сменяет поколения областей: их страницы больше не найдутся."""
+    cache.set_many(
+        {_generation_key(scope): _new_generation() for scope in scopes},
+        None,
+    )
+
+
+def normalize_query(query):
+    """Оставляет только параметры паджинации; ?page=1 равно пустому."""
+    params = [(name, query.get(name)) for name in cached_params
+              if query.get(name)]
+    if params == [('page', '1')]:
+        params = []
+    return '&'.join(f'{name}={value}' for name, value in params)
+
+
+def page_key(request, name, scopes):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    raw = f'{":".join(scopes)}|{user}|{normalize_query(request.GET)}'
+    return f'page:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _stats_key(event):
+    return f'page_cache_stats:{event}'
+
+
+class _StatsBuffer:
+    """Счётчики кеша страниц в процессе.
+
+    Попадание не должно писать в общий кеш: каждый incr в L2 — это
+    пишущая транзакция и запись в журнал изменений TieredCache.
+    Поэтому события копятся здесь и уходят в кеш одной пачкой
+    не чаще раза в stats_flush_interval секунд.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def add(self, event):
+        with self.lock:
+            self.counts[event] += 1
+            if time.monotonic() - self.flushed_at < stats_flush_interval:
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.flushed_at = time.monotonic()
+        for event, count in counts.items():
+            key = _stats_key(event)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                if not cache.add(key, count, None):
+                    cache.incr(key, count)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.flushed_at = time.monotonic()
+
+
+_stats = _StatsBuffer()
+
+
+def record(event):
+    _stats.add(event)
+
+
+def get_stats():
+    """Счётчики попаданий, устаревших ответов и промахов кеша страниц.
+
+    Счётчики других процессов видны с задержкой до stats_flush_interval.
+    """
+    _stats.flush()
+    found = cache.get_many([_stats_key(event) for event in stats_events])
+    return {event: found.get(_stats_key(event), 0)
+            for event in stats_events}
+
+
+def reset_stats():
+    _stats.reset()
+    cache.delete_many([_stats_key(event) for event in stats_events])
+
+
+def _is_fresh(entry, generation):
+    return entry['generation'] == generation and (
+        entry['fresh_until'] is None or entry['fresh_until'] > time.time())
+
+
+def _wait_for(key, generation):
+    """Ждёт, пока другой запрос соберёт страницу, не дольше wait_timeout."""
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        entry = cache.get(key)
+        if entry is not None and entry['generation'] == generation:
+            return entry
+    return None
+
+
+def _cached_response(key, scopes, fresh_for, render):
+    """Отдаёт страницу из кеша, пересобирая её не более чем одним запросом.
+
+    fresh_for — сколько секунд запись свежа независимо от поколений
+    (None — пока не сменится поколение).
+    """
+    generation = ':'.join(get_generations(scopes))
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry, generation):
+        record('hit')
+        return entry['response']
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if locked:
+        # Пока ждали блокировку, страницу мог пересобрать другой запрос.
+        rebuilt = cache.get(key)
+        if rebuilt is not None and _is_fresh(rebuilt, generation):
+            cache.delete(lock_key)
+            record('hit')
+            return rebuilt['response']
+    else:
+        if entry is None:
+            entry = _wait_for(key, generation)
+        if entry is not None:
+            record('hit' if _is_fresh(entry, generation) else 'stale')
+            return entry['response']
+    try:
+        record('miss')
+        # Реплика может отставать от смены поколения.
+        with primary_reads():
+            response = render()
+        if response.status_code == 200:
+            cache.set(key, {
+                'generation': generation,
+                'fresh_until': fresh_for and time.time() + fresh_for,
+                'response': response,
+            }, fresh_for and fresh_for * 2)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return response
+
+
+def cache_by_generation(get_scope):
+    """Кеширует GET-ответ представления до смены поколения его области.
+
+    get_scope вызывается с именованными аргументами из URL
+    и возвращает область страницы.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            scopes = [get_scope(**kwargs)]
+            key = page_key(request, view.__name__, scopes)
+            return _cached_response(
+                key, scopes, page_timeout,
+                lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def feed_author_scope(author_id):
+    return f'feed_author:{author_id}'
+
+
+def feed_scopes(user_id):
+    """Области ленты: сама лента читателя и все его авторы.
+
+    Пост автора меняет только поколение feed_author: ленты всех его
+    подписчиков устаревают разом, без общего списка читателей, который
+    параллельные запросы перезаписывали бы друг у друга.
+    """
+    author_ids = Follow.objects.filter(user_id=user_id).order_by(
+        'author_id').values_list('author_id', flat=True)
+    return [feed_scope(user_id),
+            *(feed_author_scope(author_id) for author_id in author_ids)]
+
+
+def invalidate_feed_readers(author_id):
+    """Сбрасывает закешированные ленты подписчиков автора."""
+    invalidate(feed_author_scope(author_id))
+
+
+def cache_follow_feed(view):
+    """Кеширует первые страницы ленты подписок каждого читателя."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        page = request.GET.get('page') or '1'
+        if request.method != 'GET' or not (
+                page.isdigit() and int(page) <= feed_cached_pages):
+            return view(request, *args, **kwargs)
+        user_id = request.user.pk
+        key = page_key(request, view.__name__, [feed_scope(user_id)])
+        return _cached_response(
+            key, feed_scopes(user_id), feed_timeout,
+            lambda: view(request, *args, **kwargs))
+    return wrapper
+
+
+def card_key(post):
+    """Ключ карточки поста: меняется вместе с любым показанным полем.
+
+    В версию входят поля самого поста, его группы, имя автора, готовность
+    миниатюры, размеры и число вариантов картинки, поэтому правка любого
+    из них даёт новый ключ без явной инвалидации.
+    """
+    group = post.group
+    author = post.author
+    version = '|'.join(str(value) for value in (
+        post.text, post.image.name, post.pub_date.isoformat(),
+        post.comments_count, getattr(post, 'thumbnail_pending', False),
+        len(post.image_variants.all()) if post.image else 0,
+        post.image_width, post.image_height,
+        group.title if group else '', group.slug if group else '',
+        author.username, author.get_full_name(),
+    ))
+    digest = hashlib.md5(version.encode()).hexdigest()
+    return f'card:{post.pk}:{digest}'
+
+
+def render_cards(posts):
+    """Карточки постов: кешированные одним get_many, остальные рендерятся.
+
+    Миниатюры для рендеримых карточек ищутся заранее одним запросом.
+    """
+    pending = pending_names([post.image.name for post in posts if post.image])
+    for post in posts:
+        post.thumbnail_pending = bool(post.image) and (
+            post.image.name in pending)
+    prefetch_related_objects([post for post in posts if post.image],
+                             'image_variants')
+    keys = [card_key(post) for post in posts]
+    found = cache.get_many(keys)
+    missing = {key: post for key, post in zip(keys, posts)
+               if key not in found}
+    prefetch_thumbnails(missing.values())
+    rendered = {
+        key: render_to_string(card_template, {'post': post})
+        for key, post in missing.items()
+    }
+    if rendered:
+        cache.set_many(rendered, card_timeout)
+    found.update(rendered)
+    return [mark_safe(found[key]) for key in keys]
@@ -0,0 +1,63 @@
+"""Денормализованные счётчики постов, подписок и комментариев.
+
+Счётчики меняются атомарным UPDATE ... SET n = n + 1 через F(),
+поэтому параллельные записи не теряют приращений. Расхождения,
+если они появятся, исправляет команда recount.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Post, Profile
+
+
+def get_profile(user):
+    """Профиль пользователя или пустой профиль с нулевыми счётчиками."""
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        return Profile(user=user)
+
+
+def _bump(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_profile(user_id, field, delta):
+    if _bump(Profile.objects.filter(user_id=user_id), field, delta):
+        return
+    if delta > 0:
+        try:
+            with transaction.atomic():
+                Profile.objects.create(user_id=user_id, **{field: delta})
+        except IntegrityError:
+            _bump(Profile.objects.filter(user_id=user_id), field, delta)
+
+
+def post_added(post):
+    bump_profile(post.author_id, 'posts_count', 1)
+
+
+def post_removed(post):
+    bump_profile(post.author_id, 'posts_count', -1)
+
+
+def comment_added(comment):
+    _bump(Post.objects.using(comment._state.db).filter(pk=comment.post_id),
+          'comments_count', 1)
+
+
+def comment_removed(comment):
+    _bump(Post.objects.using(comment._state.db).filter(pk=comment.post_id),
+          'comments_count', -1)
+
+
+def follow_added(follow):
+    bump_profile(follow.author_id, 'followers_count', 1)
+    bump_profile(follow.user_id, 'following_count', 1)
+
+
+def follow_removed(follow):
+    bump_profile(follow.author_id, 'followers_count', -1)
+    bump_profile(follow.user_id, 'following_count', -1)
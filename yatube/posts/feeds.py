@@ -0,0 +1,173 @@
+"""Лента подписок: гибрид рассылки при записи и сборки при чтении.
+
+Посты обычных авторов сразу раскладываются по лентам подписчиков
+(push), поэтому follow_index читает одну таблицу по индексу
+(user, pub_date) и не соединяет Post с Follow на каждом просмотре.
+Авторы, у которых подписчиков больше FEED_PULL_THRESHOLD, в ленты не
+пишутся (pull): их посты подмешиваются при чтении k-way слиянием
+по индексу pub_date каждого такого автора.
+
+Запрос подписки только переключает режим автора и ставит
+delivery_pending; удалить его записи из лент или разложить их по
+лентам тысяч подписчиков — работа команды feed_delivery, пачками.
+Пока она не закончена, автор читается как pull, а его записи
+в FeedEntry при чтении пропускаются.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import FeedEntry, Follow, Post, Profile
+from .paginators import MergedKeysetPaginator
+
+batch_size: int = 500
+
+
+def pull_threshold():
+    return getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+
+
+def push_threshold():
+    return getattr(settings, 'FEED_PUSH_THRESHOLD', pull_threshold())
+
+
+def is_pull_author(author_id):
+    return Profile.objects.filter(user_id=author_id,
+                                  pull_delivery=True).exists()
+
+
+def _entry(user_id, post):
+    return FeedEntry(user_id=user_id, post_id=post.pk,
+                     author_id=post.author_id, pub_date=post.pub_date)
+
+
+def fan_out_post(post):
+    """Кладёт пост в ленты всех подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (_entry(user_id, post) for user_id in followers.iterator()),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту читателя все посты нового автора."""
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.for_author(author_id).only(
+        'pk', 'author_id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        (_entry(user_id, post) for post in posts.iterator()),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_feed(user_id):
+    """Пересобирает ленту читателя с нуля по Follow и Post."""
+    authors = Follow.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True)
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        for author_id in authors:
+            backfill_feed(user_id, author_id)
+
+
+def update_delivery(author_id):
+    """Переключает автора между push и pull по числу подписчиков.
+
+    Записи лент не трогает: их доводит до нового режима finish_delivery.
+    """
+    profile = Profile.objects.filter(user_id=author_id).first()
+    if profile is None:
+        return
+    if profile.pull_delivery:
+        switch = profile.followers_count < push_threshold()
+    else:
+        switch = profile.followers_count > pull_threshold()
+    if switch:
+        profile.pull_delivery = not profile.pull_delivery
+        profile.delivery_pending = True
+        profile.save(update_fields=['pull_delivery', 'delivery_pending'])
+
+
+def finish_delivery(profile, size=batch_size):
+    """Доводит ленты подписчиков до режима автора пачками по size.
+
+    pull — удаляет записи автора из лент, push — раскладывает его посты
+    по лентам подписчиков. Флаг снимается, только если режим за это
+    время не сменился снова.
+    """
+    author_id = profile.user_id
+    if profile.pull_delivery:
+        entries = FeedEntry.objects.filter(author_id=author_id)
+        while True:
+            ids = list(entries.values_list('pk', flat=True)[:size])
+            if not ids:
+                break
+            FeedEntry.objects.filter(pk__in=ids).delete()
+    else:
+        followers = Follow.objects.filter(author_id=author_id).order_by('pk')
+        last = 0
+        while True:
+            batch = list(followers.filter(pk__gt=last).values_list(
+                'pk', 'user_id')[:size])
+            if not batch:
+                break
+            for _, user_id in batch:
+                backfill_feed(user_id, author_id)
+            last = batch[-1][0]
+    return Profile.objects.filter(
+        pk=author_id, pull_delivery=profile.pull_delivery,
+    ).update(delivery_pending=False)
+
+
+def follower_added(user_id, author_id):
+    update_delivery(author_id)
+    backfill_feed(user_id, author_id)
+
+
+def follower_removed(user_id, author_id):
+    prune_feed(user_id, author_id)
+    update_delivery(author_id)
+
+
+def feed_paginator(user, per_page):
+    """Собирает ленту из записей FeedEntry и постов pull-авторов."""
+    pull_authors = list(Follow.objects.filter(
+        Q(author__profile__pull_delivery=True)
+        | Q(author__profile__delivery_pending=True),
+        user=user,
+    ).values_list('author_id', flat=True))
+    entries = FeedEntry.objects.filter(user=user)
+    if pull_authors:
+        # Записи автора, чьи ленты ещё перестраиваются, неполны
+        # или лишние: его посты берутся напрямую.
+        entries = entries.exclude(author_id__in=pull_authors)
+    sources = [(
+        entries.only('post_id', 'pub_date'),
+        ('pub_date', 'post_id'),
+    )]
+    for author_id in pull_authors:
+        sources.append((
+            Post.objects.for_author(author_id).only('pk', 'pub_date'),
+            ('pub_date', 'pk'),
+        ))
+    return MergedKeysetPaginator(sources, per_page)
+
+
+def entries_to_posts(entries):
+    """Подменяет записи ленты постами, сохраняя порядок."""
+    posts = Post.objects.with_related('author', 'group').gather(
+        [entry.post_id for entry in entries])
+    return [posts[entry.post_id] for entry in entries
+            if entry.post_id in posts]
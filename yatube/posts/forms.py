@@ -1,12 +1,52 @@
+import os
+
 from django import forms
+
+from . import uploads
 from .models import Post, Comment
 
+upload_errors = {
+    'invalid': 'Загрузите правильное изображение. Файл, который вы '
+               'загрузили, поврежден или не является изображением.',
+    'format': 'Поддерживаются картинки GIF, JPEG, PNG и WebP.',
+    'too_large': 'Картинка слишком большая.',
+}
+
 
 class PostForm(forms.ModelForm):
+    # ImageField в запросе только читает заголовок (Image.open и
+    # verify) — декодирует и нормализует картинку пул uploads
+    # в clean_image.
+    image = forms.ImageField(
+        label='Картинка', help_text='Добавьте картинку к посту',
+        required=False,
+        widget=forms.ClearableFileInput(attrs={'accept': 'image/*'}))
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        """Проверяет и нормализует новую картинку в пуле процессов."""
+        image = self.cleaned_data['image']
+        if not hasattr(image, 'content_type'):
+            return image
+        if image.size > uploads.max_bytes():
+            raise forms.ValidationError(upload_errors['too_large'],
+                                        code='too_large')
+        try:
+            result = uploads.process_upload(image.read())
+        except uploads.PoolBusy:
+            raise forms.ValidationError(
+                'Сервер занят обработкой картинок, попробуйте ещё раз '
+                'через минуту.', code='busy')
+        if result.error:
+            raise forms.ValidationError(upload_errors[result.error],
+                                        code=result.error)
+        extension = 'jpg' if result.format == 'JPEG' else result.format
+        name = f'{os.path.splitext(image.name)[0]}.{extension.lower()}'
+        return uploads.ProcessedUpload(name, result)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
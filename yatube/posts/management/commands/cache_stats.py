@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, устаревшие ответы и промахи кеша страниц.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = sum(stats.values())
+        for event, count in stats.items():
+            share = count / total if total else 0
+            self.stdout.write(f'{event}: {count} ({share:.1%})')
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,164 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import ImageVariant, MediaBlob, Post
+from posts.thumbnails import source_file, thumbnail_file, thumbnail_specs
+
+
+def walk(root, directory, cutoff):
+    """Отдаёт (имя, размер) файлов каталога, изменённых раньше cutoff.
+
+    os.scandir читает по одному подкаталогу за раз, поэтому список всего
+    дерева в памяти не собирается.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime < cutoff:
+                        yield name, stat.st_size
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки постов, варианты и миниатюры, '
+            'на которые больше ничего не ссылается. Файлы моложе '
+            '--grace-hours не трогает: их пост ещё может сохраняться. '
+            'Подходит для запуска по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace-hours', type=float, default=24)
+        parser.add_argument('--quarantine', metavar='DIR',
+                            help='переносить файлы в DIR вместо удаления')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.root = settings.MEDIA_ROOT
+        self.dry_run = options['dry_run']
+        self.quarantine = options['quarantine']
+        self.batch_size = options['batch_size']
+        cutoff = time.time() - options['grace_hours'] * 60 * 60
+        count = size = 0
+        with tempfile.TemporaryDirectory() as workdir:
+            trees = (
+                ('posts', lambda: self.referenced_images,
+                 self.forget_source),
+                ('variants', lambda: self.referenced_variants, None),
+                (sorl_settings.THUMBNAIL_PREFIX.rstrip('/'),
+                 lambda: self.referenced_thumbnails(workdir),
+                 self.forget_thumbnail),
+            )
+            for directory, make_referenced, forget in trees:
+                referenced = make_referenced()
+                files = walk(self.root, directory, cutoff)
+                for batch in batches(files, self.batch_size):
+                    kept = referenced([name for name, _ in batch])
+                    for name, file_size in batch:
+                        if name in kept or not self.collect(name):
+                            continue
+                        if forget is not None and not self.dry_run:
+                            forget(name)
+                        count += 1
+                        size += file_size
+        verb = 'Найдено' if self.dry_run else (
+            'Перенесено' if self.quarantine else 'Удалено')
+        self.stdout.write(f'{verb} файлов: {count}, {size} байт')
+
+    def referenced_images(self, names):
+        """Имена из names, на которые ссылаются посты или MediaBlob."""
+        found = set(MediaBlob.objects.filter(
+            name__in=names, refs__gt=0).values_list('name', flat=True))
+        for shard in Post.objects.on_shards():
+            found.update(shard.filter(image__in=names).values_list(
+                'image', flat=True))
+        return found
+
+    def referenced_variants(self, names):
+        return set(ImageVariant.objects.filter(file__in=names).values_list(
+            'file', flat=True))
+
+    def referenced_thumbnails(self, workdir):
+        """Имена миниатюр sorl, которые шаблон попросит для живых постов.
+
+        Имя миниатюры — хеш исходника и опций, обратно его не разобрать,
+        поэтому ожидаемые имена считаются заранее, проходом по постам
+        пачками. Они пишутся во временный файл SQLite в workdir, а не
+        в память: в памяти остаётся только текущая пачка.
+        """
+        marks = sqlite3.connect(os.path.join(workdir, 'thumbnails.sqlite3'))
+        marks.execute('CREATE TABLE expected (name TEXT PRIMARY KEY)')
+        for shard in Post.objects.on_shards():
+            images = (shard.exclude(image='').order_by()
+                      .values_list('image', flat=True).distinct())
+            for batch in batches(images.iterator(self.batch_size),
+                                 self.batch_size):
+                with marks:
+                    marks.executemany(
+                        'INSERT OR IGNORE INTO expected VALUES (?)',
+                        ((thumbnail_file(name, geometry, options).name,)
+                         for name in batch
+                         for geometry, options in thumbnail_specs))
+
+        def referenced(names):
+            found = set()
+            # Не больше 500 параметров: старый SQLite разрешает 999.
+            for part in batches(names, 500):
+                placeholders = ','.join('?' * len(part))
+                found.update(name for name, in marks.execute(
+                    f'SELECT name FROM expected WHERE name IN '
+                    f'({placeholders})', part))
+            return found
+        return referenced
+
+    def collect(self, name):
+        """Удаляет файл или переносит его в карантин; False, если его нет."""
+        if self.dry_run:
+            return True
+        path = os.path.join(self.root, name)
+        try:
+            if not self.quarantine:
+                os.remove(path)
+                return True
+            target = os.path.join(self.quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def forget_source(self, name):
+        default.kvstore.delete(source_file(name), delete_thumbnails=False)
+
+    def forget_thumbnail(self, name):
+        default.kvstore.delete(ImageFile(name, default.storage),
+                               delete_thumbnails=False)
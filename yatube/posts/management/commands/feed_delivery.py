@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.feeds import finish_delivery
+from posts.models import Profile
+
+
+class Command(BaseCommand):
+    help = ('Доводит ленты подписчиков до режима доставки авторов, '
+            'у которых он сменился: удаляет записи pull-авторов и '
+            'раскладывает посты вернувшихся к push. Запускайте '
+            'периодически, например из cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        finished = 0
+        # Профилей с флагом немного, а курсор по таблице, которую
+        # обновляет finish_delivery, лучше не держать открытым.
+        for profile in list(Profile.objects.filter(delivery_pending=True)):
+            finished += finish_delivery(profile, options['batch_size'])
+        self.stdout.write(f'Перестроено авторов: {finished}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.management.commands.recount import chunks
+from posts.models import Post
+from posts.variants import describe_image
+
+fields = ['image_width', 'image_height', 'image_placeholder']
+
+
+class Command(BaseCommand):
+    help = ('Записывает размеры и LQIP-заглушки картинок постов, '
+            'загруженных до появления этих полей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(image_width=None)
+        described = 0
+        for ids in chunks(posts, options['batch_size']):
+            batch = list(Post.objects.filter(pk__in=ids).only('image'))
+            for post in batch:
+                describe_image(post)
+            Post.objects.bulk_update(batch, fields)
+            described += sum(1 for post in batch if post.image_width)
+        self.stdout.write(f'Описано картинок: {described}')
@@ -0,0 +1,48 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from posts.management.commands.recount import chunks
+from posts.models import Post
+from posts.thumbnails import init_worker, workers
+from posts.variants import build_for_ids
+
+
+class Command(BaseCommand):
+    help = ('Нарезает WebP/AVIF-варианты картинок уже написанных постов '
+            'в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='0 — без пула, в этом процессе')
+        parser.add_argument('--all', action='store_true',
+                            help='пересобрать и уже готовые варианты')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.exclude(image_variants__source=F('image'))
+        batches = chain.from_iterable(
+            chunks(shard, options['batch_size'])
+            for shard in posts.on_shards())
+        count = workers() if options['workers'] is None else options['workers']
+        if count == 0:
+            results = map(build_for_ids, batches)
+            self.report(results)
+            return
+        with ProcessPoolExecutor(
+                max_workers=count,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker) as executor:
+            self.report(executor.map(build_for_ids, batches))
+
+    def report(self, results):
+        done = failed = 0
+        for batch_done, batch_failed in results:
+            done += batch_done
+            failed += batch_failed
+        self.stdout.write(f'Нарезано картинок: {done}, с ошибкой: {failed}')
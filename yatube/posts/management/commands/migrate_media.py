@@ -0,0 +1,72 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.cache import invalidate, post_scopes
+from posts.models import ImageVariant, MediaBlob, Post
+from posts.storage import is_content_name
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов из плоского каталога posts/ '
+            'в раскладку по хешу содержимого. Работает пачками; '
+            'прерванный перенос продолжается с того же места.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--keep-old', action='store_true',
+                            help='не удалять старые файлы')
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        self.keep_old = options['keep_old']
+        posts = Post.objects.exclude(image='').select_related('group',
+                                                              'author')
+        moved = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk).order_by('pk')
+                         [:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            done = []
+            for post in batch:
+                if is_content_name(post.image.name):
+                    continue
+                if self.move(post):
+                    done.append(post)
+                else:
+                    failed += 1
+            self.recount_refs({post.image.name for post in done})
+            scopes = {scope for post in done for scope in post_scopes(post)}
+            invalidate(*scopes)
+            moved += len(done)
+        self.stdout.write(f'Перенесено картинок: {moved}, '
+                          f'не найдено: {failed}')
+
+    def move(self, post):
+        old = post.image.name
+        try:
+            with self.storage.open(old) as file:
+                new = self.storage.save(old, file)
+        except (OSError, SuspiciousFileOperation):
+            return False
+        with transaction.atomic():
+            Post.objects.filter(pk=post.pk, image=old).update(image=new)
+            ImageVariant.objects.filter(post=post, source=old).update(
+                source=new)
+        if not self.keep_old and not Post.objects.filter(image=old).exists():
+            self.storage.delete(old)
+        post.image.name = new
+        return True
+
+    def recount_refs(self, names):
+        """Ставит счётчики ссылок по фактическим постам.
+
+        storage.save уже добавил по ссылке, но после прерванного запуска
+        лишняя ссылка осталась бы навсегда.
+        """
+        for name in names:
+            MediaBlob.objects.filter(name=name).update(
+                refs=Post.objects.filter(image=name).count())
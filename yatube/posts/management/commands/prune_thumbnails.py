@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+def key_chunks(prefix, size):
+    """Отдаёт пары (ключ, значение) хранилища sorl пачками по ключу."""
+    last_key = ''
+    while True:
+        rows = list(
+            KVStoreModel.objects.filter(key__startswith=prefix,
+                                        key__gt=last_key)
+            .order_by('key').values_list('key', 'value')[:size])
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][0]
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из хранилища ключей sorl-thumbnail записи о файлах, '
+            'которых больше нет, и ссылки на них, обходя ключи пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.removed = set()
+        size = options['batch_size']
+        images = sum(self.prune_images(rows)
+                     for rows in key_chunks(add_prefix(''), size))
+        lists = sum(self.prune_lists(rows)
+                    for rows in key_chunks(add_prefix('', 'thumbnails'), size))
+        verb = 'Найдено' if self.dry_run else 'Удалено'
+        self.stdout.write(f'{verb} записей о файлах: {images}, '
+                          f'списков миниатюр: {lists}')
+
+    def delete(self, keys):
+        if keys and not self.dry_run:
+            KVStoreModel.objects.filter(key__in=keys).delete()
+            default.kvstore.cache.delete_many(keys)
+        return len(keys)
+
+    def prune_images(self, rows):
+        stale = [key for key, value in rows
+                 if not deserialize_image_file(value).exists()]
+        self.removed.update(stale)
+        return self.delete(stale)
+
+    def prune_lists(self, rows):
+        """Чистит списки миниатюр: без исходника удаляет, иначе сужает."""
+        stale, changed = [], {}
+        image_keys = [add_prefix(del_prefix(key)) for key, _ in rows]
+        listed = {add_prefix(thumbnail) for _, value in rows
+                  for thumbnail in deserialize(value)}
+        alive = set(KVStoreModel.objects.filter(
+            key__in=image_keys + list(listed)).values_list('key', flat=True)
+        ) - self.removed
+        for (key, value), image_key in zip(rows, image_keys):
+            thumbnails = deserialize(value)
+            kept = [thumbnail for thumbnail in thumbnails
+                    if add_prefix(thumbnail) in alive]
+            if image_key not in alive or not kept:
+                stale.append(key)
+            elif len(kept) < len(thumbnails):
+                changed[key] = kept
+        if changed and not self.dry_run:
+            for key, kept in changed.items():
+                default.kvstore._set(del_prefix(key), kept,
+                                     identity='thumbnails')
+        return self.delete(stale) + len(changed)
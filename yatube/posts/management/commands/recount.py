@@ -0,0 +1,85 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.feeds import update_delivery
+from posts.models import Comment, Follow, Post, Profile, User
+
+
+def chunks(queryset, size):
+    """Отдаёт id из выборки пачками по size штук по возрастанию pk."""
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def grouped_counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by()
+        .values_list(field).annotate(Count('pk'))
+    )
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики постов, подписок '
+            'и комментариев и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        fixed_profiles = sum(
+            self.recount_profiles(ids) for ids in chunks(User.objects, size))
+        fixed_posts = sum(
+            self.recount_posts(shard, ids)
+            for shard in Post.objects.on_shards()
+            for ids in chunks(shard, size))
+        self.stdout.write(f'Исправлено профилей: {fixed_profiles}, '
+                          f'постов: {fixed_posts}')
+
+    def recount_profiles(self, ids):
+        actual = {
+            'posts_count': sum(
+                (Counter(grouped_counts(shard, 'author', ids))
+                 for shard in Post.objects.on_shards()), Counter()),
+            'followers_count': grouped_counts(Follow.objects, 'author', ids),
+            'following_count': grouped_counts(Follow.objects, 'user', ids),
+        }
+        profiles = Profile.objects.in_bulk(ids)
+        created, changed = [], []
+        for user_id in ids:
+            profile = profiles.get(user_id)
+            if profile is None:
+                profile = Profile(user_id=user_id)
+                created.append(profile)
+            elif all(getattr(profile, field) == counts.get(user_id, 0)
+                     for field, counts in actual.items()):
+                continue
+            else:
+                changed.append(profile)
+            for field, counts in actual.items():
+                setattr(profile, field, counts.get(user_id, 0))
+        Profile.objects.bulk_create(created)
+        Profile.objects.bulk_update(changed, list(actual))
+        for profile in created + changed:
+            update_delivery(profile.user_id)
+        return len(created) + len(changed)
+
+    def recount_posts(self, posts, ids):
+        """Комментарии лежат в шарде своего поста, posts — выборка шарда."""
+        comments = grouped_counts(Comment.objects.using(posts.db), 'post', ids)
+        changed = []
+        for post in posts.filter(pk__in=ids).only('comments_count'):
+            actual = comments.get(post.pk, 0)
+            if post.comments_count != actual:
+                post.comments_count = actual
+                changed.append(post)
+        posts.bulk_update(changed, ['comments_count'])
+        return len(changed)
@@ -0,0 +1,143 @@
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from posts.management.commands.collect_media import batches
+from posts.management.commands.recount import chunks
+from posts.models import Comment, Post, User
+from posts.shards import author_shard, directory, hash_shard, shards
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def ids(rows):
+    return set(rows.values_list('pk', flat=True))
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты авторов и комментарии к ним в шард, который '
+            'выбирает хеш по текущему POST_SHARDS, или в --to. Сначала '
+            'строки копируются без блокировок, затем короткая транзакция '
+            'доносит изменения, переключает AuthorShard и удаляет строки '
+            'из старого шарда. Остальные авторы в это время работают как '
+            'обычно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='кого переносить; по умолчанию — всех '
+                                 'авторов, чей шард не совпадает с хешем')
+        parser.add_argument('--to', metavar='ALIAS',
+                            help='шард для всех указанных авторов')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, кто переедет')
+
+    def handle(self, *args, **options):
+        target = options['to']
+        if target is not None and target not in shards():
+            raise CommandError(f'{target} нет в POST_SHARDS')
+        if target is not None and not options['usernames']:
+            raise CommandError('С --to укажите имена авторов.')
+        self.size = options['batch_size']
+        moved = 0
+        for author_id in self.authors(options['usernames']):
+            source = author_shard(author_id)
+            destination = target or hash_shard(author_id)
+            if source == destination:
+                continue
+            self.stdout.write(f'{author_id}: {source} → {destination}')
+            if not options['dry_run']:
+                self.move(author_id, source, destination)
+            moved += 1
+        verb = 'Переедет' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(f'{verb} авторов: {moved}')
+
+    def authors(self, usernames):
+        if usernames:
+            users = User.objects.filter(username__in=usernames)
+            missing = set(usernames) - set(
+                users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(
+                    f'Пользователи не найдены: {", ".join(sorted(missing))}')
+            return sorted(users.values_list('pk', flat=True))
+        found = set()
+        for shard in Post.objects.on_shards():
+            found.update(shard.order_by().values_list(
+                'author_id', flat=True).distinct())
+        return sorted(found)
+
+    def move(self, author_id, source, target):
+        # Первый проход без блокировок: источник работает как обычно,
+        # поэтому копия может отстать — её доносит следующий проход.
+        self.sync(author_id, source, target, prune=True)
+        prune = True
+        while True:
+            with ExitStack() as stack:
+                for alias in {source, target, DEFAULT_DB_ALIAS}:
+                    stack.enter_context(transaction.atomic(using=alias))
+                self.sync(author_id, source, target, prune)
+                directory().update_or_create(author_id=author_id,
+                                             defaults={'alias': target})
+                self.delete(Comment, source,
+                            ids(self.comments(source, author_id)))
+                self.delete(Post, source, ids(self.posts(source, author_id)))
+            # Пост, который начали писать до переключения каталога,
+            # мог попасть в старый шард уже после транзакции.
+            if not self.posts(source, author_id).exists():
+                return
+            prune = False
+
+    @staticmethod
+    def posts(alias, author_id):
+        return Post.objects.using(alias).filter(author_id=author_id)
+
+    @staticmethod
+    def comments(alias, author_id):
+        return Comment.objects.using(alias).filter(post__author_id=author_id)
+
+    def sync(self, author_id, source, target, prune):
+        """Делает строки автора в target такими же, как в source.
+
+        Без prune лишние строки в target остаются: так доносятся посты,
+        опоздавшие после переключения.
+        """
+        pairs = ((Post, self.posts), (Comment, self.comments))
+        if prune:
+            for model, rows in reversed(pairs):
+                self.delete(model, target, ids(rows(target, author_id))
+                            - ids(rows(source, author_id)))
+        for model, rows in pairs:
+            self.copy(model, rows(source, author_id),
+                      rows(target, author_id))
+
+    def copy(self, model, source_rows, target_rows):
+        """Вставляет новые и обновляет изменённые строки пачками."""
+        fields = columns(model)
+        for batch in chunks(source_rows, self.size):
+            current = {row[0]: row for row in target_rows.filter(
+                pk__in=batch).values_list(*fields)}
+            created, changed = [], []
+            for row in source_rows.filter(pk__in=batch).values_list(*fields):
+                if current.get(row[0]) == row:
+                    continue
+                obj = model(**dict(zip(fields, row)))
+                (changed if row[0] in current else created).append(obj)
+            target_rows.bulk_create(created)
+            target_rows.bulk_update(changed, fields[1:])
+
+    def delete(self, model, alias, pks):
+        """DELETE без сигналов: строки переехали, а не удалены.
+
+        Сигналы уменьшили бы счётчики и освободили бы картинки.
+        """
+        table = connections[alias].ops.quote_name(model._meta.db_table)
+        with connections[alias].cursor() as cursor:
+            for batch in batches(sorted(pks), self.size):
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id IN ({placeholders})',
+                    batch)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+from posts.shards import shards
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет полнотекстовый индекс постов пачками. '
+            'Нужна после миграции 0012 для уже написанных постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in shards():
+            done = 0
+            for done in rebuild_index(options['batch_size'], alias):
+                pass
+            total += done
+        self.stdout.write(f'Проиндексировано постов: {total}')
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_profiles(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Profile = apps.get_model('posts', 'Profile')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    threshold = getattr(settings, 'FEED_PULL_THRESHOLD', 10000)
+    counts = Follow.objects.values('author').annotate(n=Count('id'))
+    for row in counts.iterator():
+        pull = row['n'] > threshold
+        Profile.objects.create(user_id=row['author'],
+                               followers_count=row['n'],
+                               pull_delivery=pull)
+        if pull:
+            FeedEntry.objects.filter(author_id=row['author']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0008_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('pull_delivery', models.BooleanField(default=False, help_text='Посты автора не раскладываются по лентам, а подмешиваются в ленту при чтении', verbose_name='Доставка при чтении')),
+            ],
+            options={
+                'verbose_name': 'Профиль',
+                'verbose_name_plural': 'Профили',
+            },
+        ),
+        migrations.RunPython(fill_profiles, migrations.RunPython.noop),
+    ]
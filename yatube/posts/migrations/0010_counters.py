@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Profile = apps.get_model('posts', 'Profile')
+    posts = dict(Post.objects.order_by().values_list('author').annotate(
+        Count('id')))
+    following = dict(Follow.objects.values_list('user').annotate(Count('id')))
+    for user_id in User.objects.values_list('pk', flat=True).iterator():
+        profile, _ = Profile.objects.get_or_create(user_id=user_id)
+        profile.posts_count = posts.get(user_id, 0)
+        profile.following_count = following.get(user_id, 0)
+        profile.save(update_fields=['posts_count', 'following_count'])
+    comments = Comment.objects.order_by().values_list('post').annotate(
+        Count('id'))
+    for post_id, count in comments.iterator():
+        Post.objects.filter(pk=post_id).update(comments_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Подписок'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Постов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='delivery_pending',
+            field=models.BooleanField(default=False, help_text='Режим доставки сменился, а записи лент ещё не удалены или не разложены командой feed_delivery', verbose_name='Ленты перестраиваются'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .shards import PostQuerySet, ShardedQuerySet
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -27,23 +30,41 @@ class Post(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name="posts",
-                               verbose_name='Автор')
+                               verbose_name='Автор',
+                               db_constraint=False)
     group = models.ForeignKey(Group,
                               on_delete=models.SET_NULL,
                               blank=True,
                               null=True,
+                              db_constraint=False,
                               related_name="posts",
                               verbose_name="Группа",
                               help_text="Выберите группу поста")
     image = models.ImageField('Картинка',
                               upload_to='posts/',
+                              storage=ContentAddressedStorage(),
                               blank=True,
                               help_text='Добавьте картинку к посту')
+    image_width = models.PositiveIntegerField('Ширина картинки', null=True,
+                                              blank=True, editable=False)
+    image_height = models.PositiveIntegerField('Высота картинки', null=True,
+                                               blank=True, editable=False)
+    image_placeholder = models.TextField('Заглушка картинки', blank=True,
+                                         editable=False)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -57,16 +78,23 @@ class Comment(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='comments',
-                               verbose_name='Комментатор'
+                               verbose_name='Комментатор',
+                               db_constraint=False,
                                )
     text = models.TextField('Текст', help_text='Текст нового комментария')
     created = models.DateTimeField("Дата публикации комментария",
                                    auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -90,6 +118,147 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_follow')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class Profile(models.Model):
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='profile',
+                                verbose_name='Пользователь',
+                                )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    pull_delivery = models.BooleanField(
+        'Доставка при чтении',
+        default=False,
+        help_text='Посты автора не раскладываются по лентам, '
+                  'а подмешиваются в ленту при чтении',
+    )
+    delivery_pending = models.BooleanField(
+        'Ленты перестраиваются',
+        default=False,
+        help_text='Режим доставки сменился, а записи лент ещё не '
+                  'удалены или не разложены командой feed_delivery',
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries',
+                             verbose_name='Читатель',
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='feed_entries',
+                             verbose_name='Пост',
+                             db_constraint=False,
+                             )
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор',
+                               )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class ImageVariant(models.Model):
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='image_variants',
+                             verbose_name='Пост',
+                             db_constraint=False,
+                             )
+    source = models.CharField('Исходная картинка', max_length=255)
+    format = models.CharField('Формат', max_length=10)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    file = models.FileField('Файл', max_length=255)
+
+    class Meta:
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+        ordering = ['format', 'width']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'format', 'width'],
+                                    name='unique_image_variant')
+        ]
+
+    def __str__(self):
+        return f'{self.source} {self.format} {self.width}w'
+
+
+class MediaBlob(models.Model):
+    name = models.CharField('Файл', max_length=255, primary_key=True)
+    size = models.BigIntegerField('Размер, байт')
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл медиа'
+        verbose_name_plural = 'Файлы медиа'
+
+    def __str__(self):
+        return self.name
+
+
+class AuthorShard(models.Model):
+    author = models.OneToOneField(User,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='+',
+                                  verbose_name='Автор',
+                                  )
+    alias = models.CharField('База', max_length=100)
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+    def __str__(self):
+        return f'{self.author_id} в {self.alias}'
+
+
+class IdSequence(models.Model):
+    name = models.CharField('Таблица', max_length=100, primary_key=True)
+    value = models.BigIntegerField('Последний id', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик id'
+        verbose_name_plural = 'Счётчики id'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
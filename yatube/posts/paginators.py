@@ -0,0 +1,170 @@
+import binascii
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+FeedItem = namedtuple('FeedItem', ('pub_date', 'post_id'))
+
+
+def encode_cursor(date, pk):
+    """Упаковывает пару (дата, id) в строку для GET-параметра."""
+    raw = f'{date.isoformat()}|{pk}'.encode()
+    return urlsafe_base64_encode(raw)
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор; для битой строки возвращает None."""
+    try:
+        date, pk = urlsafe_base64_decode(cursor).decode().split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (TypeError, ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if date is None:
+        return None
+    return date, pk
+
+
+def keyset_queryset(queryset, keys, key=None, newer=False):
+    """Упорядочивает выборку по ключу и отсекает всё до курсора.
+
+    По умолчанию записи идут от новых к старым и берутся строго старше
+    курсора; с newer=True — от старых к новым и строго новее курсора.
+    """
+    date_key, pk_key = keys
+    lookup, prefix = ('gt', '') if newer else ('lt', '-')
+    queryset = queryset.order_by(f'{prefix}{date_key}', f'{prefix}{pk_key}')
+    if key is None:
+        return queryset
+    date, pk = key
+    return queryset.filter(
+        Q(**{f'{date_key}__{lookup}': date})
+        | Q(**{date_key: date, f'{pk_key}__{lookup}': pk})
+    )
+
+
+class KeysetPaginator(Paginator):
+    """Паджинатор по курсору (дата, id): без COUNT(*) и без OFFSET.
+
+    Курсоры after/before указывают на последнюю и первую запись
+    соседней страницы, поэтому глубокие страницы читаются по индексу
+    так же быстро, как первая. Параметр ?page=N по-прежнему работает
+    через OFFSET и нужен для старых ссылок.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        self.keys = keys
+        super().__init__(keyset_queryset(object_list, keys), per_page)
+        self._known_pages = 1
+        self._known_count = 0
+
+    @property
+    def count(self):
+        """Нижняя оценка: сколько записей видно до текущей страницы."""
+        return self._known_count
+
+    @property
+    def num_pages(self):
+        """Нижняя оценка: текущая страница плюс одна, если есть старше."""
+        return self._known_pages
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def get_page(self, number=None, after=None, before=None):
+        try:
+            number = self.validate_number(number)
+        except (PageNotAnInteger, EmptyPage):
+            number = 1
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        limit = self.per_page + 1
+        if after is not None:
+            rows = self._rows(limit, key=after)
+        elif before is not None and number > 1:
+            rows = self._rows(self.per_page, key=before, newer=True)
+            rows.reverse()
+            if len(rows) == self.per_page:
+                return self._build_page(rows, number, has_next=True)
+            number = 1
+            rows = self._rows(limit)
+        else:
+            rows = self._rows(limit, offset=(number - 1) * self.per_page)
+        has_next = len(rows) > self.per_page
+        return self._build_page(rows[:self.per_page], number, has_next)
+
+    def page(self, number):
+        return self.get_page(number)
+
+    def _rows(self, limit, key=None, newer=False, offset=0):
+        queryset = keyset_queryset(self.object_list, self.keys, key, newer)
+        return list(queryset[offset:offset + limit])
+
+    def _cursor(self, obj):
+        date_key, pk_key = self.keys
+        return encode_cursor(getattr(obj, date_key), getattr(obj, pk_key))
+
+    def _build_page(self, rows, number, has_next):
+        self._known_pages = number + 1 if has_next else number
+        self._known_count = (
+            (number - 1) * self.per_page + len(rows) + int(has_next)
+        )
+        page = self._get_page(rows, number, self)
+        page.next_cursor = (
+            self._cursor(rows[-1]) if has_next and rows else None
+        )
+        page.previous_cursor = (
+            self._cursor(rows[0]) if number > 1 and rows else None
+        )
+        return page
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """Паджинатор по нескольким выборкам, слитым k-way merge.
+
+    Каждый источник — пара (queryset, (поле даты, поле id поста)).
+    Из каждого читается не больше страницы по его собственному индексу,
+    результат сливается через heapq.merge и отдаётся как FeedItem.
+    Пост, найденный в нескольких источниках, попадает на страницу один раз.
+    """
+
+    def __init__(self, sources, per_page):
+        self.sources = sources
+        self.keys = FeedItem._fields
+        Paginator.__init__(self, sources, per_page)
+        self._known_pages = 1
+        self._known_count = 0
+
+    def _rows(self, limit, key=None, newer=False, offset=0):
+        streams = [
+            self._stream(keyset_queryset(queryset, keys, key, newer),
+                         keys, offset + limit)
+            for queryset, keys in self.sources
+        ]
+        merged = heapq.merge(*streams, reverse=not newer)
+        return list(islice(self._unique(merged), offset, offset + limit))
+
+    @staticmethod
+    def _stream(queryset, keys, limit):
+        date_key, pk_key = keys
+        for row in queryset[:limit]:
+            yield FeedItem(getattr(row, date_key), getattr(row, pk_key))
+
+    @staticmethod
+    def _unique(items):
+        previous = None
+        for item in items:
+            if item != previous:
+                yield item
+            previous = item
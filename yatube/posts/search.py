@@ -0,0 +1,188 @@
+"""Полнотекстовый поиск по постам через таблицу FTS5 posts_post_fts.
+
+Индекс внешнего содержимого: FTS5 хранит только токены, а текст читает
+из posts_post. Триггеры из миграции 0012 обновляют его при каждой
+записи, в том числе при bulk_create и update(). SQLite-миграции Django
+пересоздают posts_post целиком и теряют триггеры, поэтому после каждого
+migrate их восстанавливает restore_triggers.
+"""
+import binascii
+import re
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .shards import shards
+
+fts_table = 'posts_post_fts'
+snippet_tokens: int = 16
+_mark_open, _mark_close = '\x02', '\x03'
+
+triggers = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {fts_table} (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {fts_table} ({fts_table}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {fts_table} ({fts_table}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {fts_table} (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+
+SearchResult = namedtuple('SearchResult', ('post', 'snippet'))
+SearchPage = namedtuple('SearchPage', ('results', 'next_cursor'))
+
+
+def restore_triggers(using='default', **kwargs):
+    """Обработчик post_migrate: возвращает триггеры, если индекс уже есть."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if fts_table not in connection.introspection.table_names(cursor):
+            return
+        for statement in triggers:
+            cursor.execute(statement)
+
+
+def build_match(query):
+    """Превращает ввод пользователя в безопасный запрос MATCH.
+
+    Синтаксис FTS5 наружу не выставляется: каждое слово берётся в кавычки
+    как префикс, слова объединяются через AND. Без слов — None.
+    """
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def encode_rank_cursor(rank, pk):
+    return urlsafe_base64_encode(f'{rank!r}|{pk}'.encode())
+
+
+def decode_rank_cursor(cursor):
+    """Распаковывает курсор (ранг, id); для битой строки возвращает None."""
+    try:
+        rank, pk = urlsafe_base64_decode(cursor).decode().split('|')
+        return float(rank), int(pk)
+    except (TypeError, ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet).replace(_mark_open, '<mark>')
+                     .replace(_mark_close, '</mark>'))
+
+
+def search_posts(query, per_page, after=None):
+    """Страница результатов по BM25 с подсвеченными фрагментами.
+
+    Лучшие совпадения идут первыми (у bm25() они меньше), при равном
+    ранге — по id. Курсор after — пара (ранг, id) последнего результата
+    предыдущей страницы.
+    """
+    match = build_match(query)
+    if match is None:
+        return SearchPage([], None)
+    key = decode_rank_cursor(after) if after else None
+    # Ранг и LIMIT считаются по одним rowid, а snippet() — только для
+    # строк страницы: иначе фрагмент подсвечивался бы у каждого
+    # совпадения, а на частых словах их тысячи.
+    ranked = f'''
+        SELECT rowid, score FROM (
+            SELECT rowid, bm25({fts_table}) AS score
+            FROM {fts_table} WHERE {fts_table} MATCH %s
+        )
+    '''
+    params = [match]
+    if key is not None:
+        ranked += 'WHERE score > %s OR (score = %s AND rowid > %s) '
+        params += [key[0], key[0], key[1]]
+    ranked += 'ORDER BY score, rowid LIMIT %s'
+    params.append(per_page + 1)
+    sql = f'''
+        SELECT page.rowid, page.score,
+               snippet({fts_table}, 0, %s, %s, '…', %s)
+        FROM ({ranked}) AS page
+        JOIN {fts_table} ON {fts_table}.rowid = page.rowid
+        WHERE {fts_table} MATCH %s
+    '''
+    params = [_mark_open, _mark_close, snippet_tokens, *params, match]
+    rows = []
+    # У каждого шарда свой индекс; страницы шардов сливаются по рангу.
+    for alias in shards():
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows.extend(cursor.fetchall())
+    rows.sort(key=lambda row: (row[1], row[0]))
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.with_related('author', 'group').gather(
+        [pk for pk, _, _ in rows])
+    results = [SearchResult(posts[pk], _highlight(snippet))
+               for pk, _, snippet in rows if pk in posts]
+    next_cursor = (encode_rank_cursor(rows[-1][1], rows[-1][0])
+                   if has_next else None)
+    return SearchPage(results, next_cursor)
+
+
+def filter_matching(queryset, query):
+    """Оставляет в выборке постов только найденные индексом."""
+    match = build_match(query)
+    if match is None:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s',
+        [match]))
+
+
+def rebuild_index(batch_size, using=DEFAULT_DB_ALIAS):
+    """Заполняет индекс базы using заново пачками по batch_size постов.
+
+    Граница берётся до начала: посты, созданные во время работы, уже
+    добавлены триггером и второй раз не попадут. Удалять посты, пока
+    индекс заполняется, нельзя: триггер вычел бы из индекса то, чего
+    в нём ещё нет. Отдаёт число обработанных постов после каждой пачки.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(id) FROM posts_post')
+        last_id, = cursor.fetchone()
+        cursor.execute(
+            f"INSERT INTO {fts_table} ({fts_table}) VALUES ('delete-all')")
+    if last_id is None:
+        return
+    ids = Post.objects.using(using).filter(pk__lte=last_id).order_by(
+        'pk').values_list('pk', flat=True)
+    done, current = 0, 0
+    while True:
+        batch = list(ids.filter(pk__gt=current)[:batch_size])
+        if not batch:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {fts_table} (rowid, text) SELECT id, text '
+                f'FROM posts_post WHERE id BETWEEN %s AND %s',
+                [batch[0], batch[-1]])
+        done += len(batch)
+        current = batch[-1]
+        yield done
@@ -0,0 +1,247 @@
+"""Шардирование постов и комментариев по автору.
+
+Посты автора и комментарии к ним лежат в одной базе из POST_SHARDS.
+Новый автор получает шард по rendezvous-хешу author_id: когда шардов
+становится больше, шард по хешу меняется только у ~1/N авторов. Где
+автор лежит на самом деле, записано в AuthorShard в основной базе;
+автор без записи лежит в первом шарде — там остались посты, написанные
+до шардирования. Переносит авторов команда reshard.
+
+id постов и комментариев выдаёт счётчик IdSequence в основной базе,
+поэтому они уникальны во всех шардах и не меняются при переезде.
+
+Запросы одного автора идут в его шард (Post.objects.for_author,
+author.posts), запросы по всем авторам — во все шарды с k-way слиянием
+по pub_date. С одним шардом (по умолчанию) всё работает как раньше
+и без лишних запросов.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+from django.db.models import F, Max
+
+from core.routers import record_write, replicas
+
+from .paginators import MergedKeysetPaginator
+
+sharded_models = ('posts.post', 'posts.comment')
+
+
+def shards():
+    return getattr(settings, 'POST_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def is_sharded():
+    return len(shards()) > 1
+
+
+def home_shard():
+    return shards()[0]
+
+
+def hash_shard(author_id, aliases=None):
+    """Шард по rendezvous-хешу: тот, у которого вес пары больше."""
+    def weight(alias):
+        digest = hashlib.blake2b(f'{alias}:{author_id}'.encode(),
+                                 digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    return max(aliases or shards(), key=weight)
+
+
+def directory():
+    from .models import AuthorShard
+
+    return AuthorShard.objects.using(DEFAULT_DB_ALIAS)
+
+
+def author_shard(author_id):
+    """Шард, в котором сейчас лежат посты автора."""
+    if not is_sharded():
+        return home_shard()
+    alias = directory().filter(author_id=author_id).values_list(
+        'alias', flat=True).first()
+    return alias or home_shard()
+
+
+def place_author(author_id):
+    """Шард для нового поста; автору без записи выбирает и записывает."""
+    from .models import Post
+
+    if not is_sharded():
+        return home_shard()
+    alias = directory().filter(author_id=author_id).values_list(
+        'alias', flat=True).first()
+    if alias:
+        return alias
+    home = home_shard()
+    if Post.objects.using(home).filter(author_id=author_id).exists():
+        alias = home
+    else:
+        alias = hash_shard(author_id)
+    entry, _ = directory().get_or_create(author_id=author_id,
+                                         defaults={'alias': alias})
+    return entry.alias
+
+
+def max_id(model):
+    found = (model._default_manager.using(alias).aggregate(Max('pk'))
+             for alias in shards())
+    return max((result['pk__max'] or 0 for result in found), default=0)
+
+
+def next_id(model):
+    """Следующий id для model, общий для всех шардов."""
+    from .models import IdSequence
+
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    name = model._meta.db_table
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(value=F('value') + 1):
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    sequences.create(name=name, value=max_id(model) + 1)
+            except IntegrityError:
+                sequences.filter(name=name).update(value=F('value') + 1)
+        return sequences.values_list('value', flat=True).get(name=name)
+
+
+def assign_id(instance):
+    """Выдаёт новому посту или комментарию id из общего счётчика."""
+    if instance.pk is None and is_sharded():
+        instance.pk = next_id(type(instance))
+
+
+def merged_paginator(queryset, per_page):
+    """Паджинатор по всем шардам: k-way слияние их страниц по pub_date.
+
+    Страница состоит из FeedItem; посты по ним загружает
+    feeds.entries_to_posts.
+    """
+    return MergedKeysetPaginator(
+        [(shard.only('pk', 'pub_date'), ('pub_date', 'pk'))
+         for shard in queryset.on_shards()],
+        per_page,
+    )
+
+
+class ShardedQuerySet(models.QuerySet):
+
+    def on_shards(self):
+        """Та же выборка в каждом шарде."""
+        return [self.using(alias) for alias in shards()]
+
+    def locate(self, **lookup):
+        """get() по шардам: объект из первого шарда, где он нашёлся."""
+        if not is_sharded():
+            return self.get(**lookup)
+        for queryset in self.on_shards():
+            try:
+                return queryset.get(**lookup)
+            except self.model.DoesNotExist:
+                continue
+        raise self.model.DoesNotExist(
+            f'{self.model._meta.object_name} matching query does not exist.')
+
+    def gather(self, ids):
+        """in_bulk() по всем шардам."""
+        if not is_sharded():
+            return self.in_bulk(ids)
+        found = {}
+        for queryset in self.on_shards():
+            found.update(queryset.in_bulk(ids))
+        return found
+
+    def with_related(self, *fields):
+        """select_related, а при шардах — prefetch_related.
+
+        Пользователи и группы лежат в основной базе, JOIN в шарде
+        их не найдёт.
+        """
+        if is_sharded():
+            return self.prefetch_related(*fields)
+        return self.select_related(*fields)
+
+    def create(self, **kwargs):
+        # Без using шард выбирает роутер по самому объекту.
+        if self._db is not None or not is_sharded():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class PostQuerySet(ShardedQuerySet):
+
+    def for_author(self, author_id):
+        """Посты автора из его шарда."""
+        posts = self.filter(author_id=author_id)
+        if not is_sharded():
+            return posts
+        return posts.using(author_shard(author_id))
+
+
+class ShardRouter:
+    """Посты и комментарии — в шард автора поста.
+
+    Остальные модели и выборки без подсказки (instance) роутер
+    пропускает дальше по DATABASE_ROUTERS.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not self.routes(model):
+            return None
+        return self.shard_of(model, hints.get('instance'), writing=False)
+
+    def db_for_write(self, model, **hints):
+        if not self.routes(model):
+            return None
+        record_write()
+        return self.shard_of(model, hints.get('instance'), writing=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Пост в шарде ссылается на автора и группу в основной базе.
+        if not is_sharded():
+            return None
+        aliases = {DEFAULT_DB_ALIAS, *shards(), *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    @staticmethod
+    def routes(model):
+        return is_sharded() and model._meta.label_lower in sharded_models
+
+    def shard_of(self, model, instance, writing):
+        from .models import Comment, Post
+
+        if isinstance(instance, (Post, Comment)) and (
+                not instance._state.adding):
+            return instance._state.db
+        if isinstance(instance, Comment):
+            return self.post_shard(instance)
+        if isinstance(instance, Post):
+            author_id = instance.author_id
+        elif model is Post and isinstance(instance, get_user_model()):
+            author_id = instance.pk
+        else:
+            return None
+        if author_id is None:
+            return None
+        return place_author(author_id) if writing else author_shard(author_id)
+
+    @staticmethod
+    def post_shard(comment):
+        """Комментарий лежит рядом со своим постом."""
+        from .models import Comment, Post
+
+        if Comment._meta.get_field('post').is_cached(comment):
+            return comment.post._state.db
+        if comment.post_id is None:
+            return None
+        try:
+            post = Post.objects.only('pk').locate(pk=comment.post_id)
+        except Post.DoesNotExist:
+            return None
+        return post._state.db
@@ -0,0 +1,182 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, feeds, shards, thumbnails, variants
+from .cache import (author_scopes, feed_scope, group_scopes, invalidate,
+                    invalidate_feed_readers, post_scopes, profile_scope,
+                    user_scopes)
+from .models import (Comment, FeedEntry, Follow, Group, ImageVariant, Post,
+                     User)
+
+shown_group_fields = ('title', 'slug', 'description')
+shown_user_fields = ('username', 'first_name', 'last_name')
+
+
+def previous_values(instance, using, fields, update_fields):
+    """Значения fields в базе до сохранения.
+
+    None — у нового объекта и когда сохраняются другие поля.
+    """
+    if instance.pk is None or (update_fields is not None
+                               and not set(update_fields) & set(fields)):
+        return None
+    return type(instance)._default_manager.using(using).filter(
+        pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, using, **kwargs):
+    shards.assign_id(instance)
+    instance._previous_group_id, instance._previous_image = (
+        Post.objects.using(using).filter(pk=instance.pk).values_list(
+            'group_id', 'image').first() or (None, None))
+    # Новая загрузка берёт ссылку на файл, даже если его имя не
+    # изменилось: те же байты дают то же имя.
+    instance._image_uploaded = bool(instance.image) and (
+        not instance.image._committed)
+    if not instance.image:
+        instance.image_width = instance.image_height = None
+        instance.image_placeholder = ''
+    elif instance.image.name != instance._previous_image:
+        variants.describe_image(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.post_added(instance)
+        feeds.fan_out_post(instance)
+    if instance.image and instance.image.name != instance._previous_image:
+        thumbnails.schedule(instance.image.name)
+    if instance._previous_image and (
+            instance._image_uploaded
+            or instance._previous_image != instance.image.name):
+        release_image(instance._previous_image)
+    invalidate(*post_scopes(instance, [instance._previous_group_id]))
+    invalidate_feed_readers(instance.author_id)
+
+
+def release_image(name):
+    storage = Post._meta.get_field('image').storage
+    transaction.on_commit(lambda: storage.release(name))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, using, **kwargs):
+    counters.post_removed(instance)
+    if instance.image:
+        release_image(instance.image.name)
+    if using != DEFAULT_DB_ALIAS:
+        # Каскад из шарда не доходит до записей в основной базе.
+        FeedEntry.objects.filter(post_id=instance.pk).delete()
+        ImageVariant.objects.filter(post_id=instance.pk).delete()
+    invalidate(*post_scopes(instance))
+    invalidate_feed_readers(instance.author_id)
+
+
+def invalidate_comment(comment):
+    try:
+        post = comment.post
+    except Post.DoesNotExist:
+        return
+    invalidate(*post_scopes(post))
+    invalidate_feed_readers(post.author_id)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, **kwargs):
+    shards.assign_id(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+    invalidate_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_removed(instance)
+    invalidate_comment(instance)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, using, update_fields, **kwargs):
+    instance._previous_shown = previous_values(
+        instance, using, shown_user_fields, update_fields)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Вход в систему тоже сохраняет пользователя (last_login):
+    # страницы сбрасываются, только если изменилось показанное на них.
+    previous = instance._previous_shown
+    current = tuple(getattr(instance, field) for field in shown_user_fields)
+    if created or previous is None or previous == current:
+        return
+    invalidate(*author_scopes(instance.pk, {previous[0], instance.username}))
+    invalidate_feed_readers(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    # Каскад Django удаляет только то, что лежит в базе пользователя.
+    for alias in shards.shards():
+        if alias != using:
+            Post.objects.using(alias).filter(author=instance).delete()
+            Comment.objects.using(alias).filter(author=instance).delete()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate(profile_scope(instance.username))
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, using, update_fields, **kwargs):
+    instance._previous_shown = previous_values(
+        instance, using, shown_group_fields, update_fields)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    previous = instance._previous_shown
+    current = tuple(getattr(instance, field) for field in shown_group_fields)
+    if created or previous is None or previous == current:
+        return
+    invalidate(*group_scopes(instance.pk, {previous[1], instance.slug}))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, using, **kwargs):
+    # SET_NULL обновляет посты без сигналов: области считаются заранее.
+    instance._scopes = group_scopes(instance.pk, [instance.slug])
+    for alias in shards.shards():
+        if alias != using:
+            Post.objects.using(alias).filter(group=instance).update(
+                group=None)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate(*instance._scopes)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.follow_added(instance)
+        feeds.follower_added(instance.user_id, instance.author_id)
+    invalidate(*user_scopes(instance, 'author', 'user'),
+               feed_scope(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_removed(instance)
+    feeds.follower_removed(instance.user_id, instance.author_id)
+    invalidate(*user_scopes(instance, 'author', 'user'),
+               feed_scope(instance.user_id))
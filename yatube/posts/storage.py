@@ -0,0 +1,109 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется SHA-256 своего содержимого и раскладывается по двум
+уровням подкаталогов: posts/ab/cd/abcd….jpg. В каталоге не бывает
+больше 256 записей, а одинаковые загрузки занимают место один раз.
+Сколько полей ссылается на файл, хранит MediaBlob; delete только
+уменьшает счётчик и стирает файл, когда ссылок не осталось.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+content_name_re = re.compile(
+    r'^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+
+def is_content_name(name):
+    return bool(content_name_re.match(name or ''))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, digest):
+        """Имя по хешу в каталоге upload_to исходного имени."""
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            f'{digest}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        # Имя из хеша уникально по построению; одинаковое имя — тот же файл.
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        name = self.content_name(name, digest.hexdigest())
+        if self._acquire(name, size) or not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _acquire(self, name, size):
+        """Учитывает ссылку на файл; True, если запись MediaBlob новая."""
+        from .models import MediaBlob
+
+        blobs = MediaBlob.objects.filter(name=name)
+        if blobs.update(refs=F('refs') + 1):
+            return False
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, refs=1)
+        except IntegrityError:
+            blobs.update(refs=F('refs') + 1)
+            return False
+        return True
+
+    def _write(self, name, content):
+        """Пишет файл через временный и os.replace.
+
+        Ссылка учитывается до записи. Новый MediaBlob пишет файл всегда:
+        параллельный delete последней ссылки не оставит запись без
+        файла. Повторная загрузка того же содержимого пишет файл, только
+        если его нет на диске.
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'wb') as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(temporary, self.file_permissions_mode)
+        os.replace(temporary, path)
+
+    def release(self, name):
+        """Снимает одну ссылку на файл; последняя удаляет его с диска.
+
+        Файлы, которых нет в MediaBlob (загруженные до этого хранилища),
+        не трогает: их убирает сборщик мусора. Файл стирается до
+        коммита, пока транзакция держит блокировку: параллельная
+        загрузка тех же байтов создаст MediaBlob и запишет файл заново
+        только после этого.
+        """
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blobs = MediaBlob.objects.filter(name=name)
+            if blobs.filter(refs__gt=1).update(refs=F('refs') - 1):
+                return
+            if blobs.delete()[0]:
+                super().delete(name)
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).exists():
+            self.release(name)
+        else:
+            super().delete(name)
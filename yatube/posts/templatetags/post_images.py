@@ -0,0 +1,59 @@
+import logging
+
+from django import template
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+
+from ..thumbnails import pending_names, thumbnail_specs
+from ..variants import picture_sources
+
+register = template.Library()
+logger = logging.getLogger(__name__)
+
+
+def display_size(post, geometry):
+    """Размер миниатюры по сохранённым размерам исходника, без чтения файла.
+
+    Миниатюра вписывается в рамку geometry и растягивается до неё, как
+    с upscale=True в thumbnail_specs.
+    """
+    box_width, box_height = map(int, geometry.split('x'))
+    if not (post.image_width and post.image_height):
+        return box_width, box_height
+    scale = min(box_width / post.image_width, box_height / post.image_height)
+    return (max(1, round(post.image_width * scale)),
+            max(1, round(post.image_height * scale)))
+
+
+@register.inclusion_tag('includes/picture.html')
+def post_picture(post):
+    """<picture> с вариантами картинки поста или заглушка, пока она режется.
+
+    Миниатюра sorl остаётся в <img> для браузеров без WebP и AVIF.
+    Размеры и размытая заглушка берутся из полей поста, поэтому вёрстка
+    не прыгает, пока картинка грузится лениво.
+    """
+    geometry, options = thumbnail_specs[0]
+    width, height = display_size(post, geometry)
+    context = {'width': width, 'height': height, 'image': None,
+               'pending': False, 'sources': [],
+               'placeholder': post.image_placeholder, 'max_width':
+               geometry.split('x')[0]}
+    if not post.image:
+        return context
+    pending = getattr(post, 'thumbnail_pending', None)
+    if pending is None:
+        pending = bool(pending_names([post.image.name]))
+    context['pending'] = pending
+    if not pending:
+        context['sources'] = picture_sources(post)
+        try:
+            context['image'] = (
+                getattr(post, 'thumbnail_image', None)
+                or get_thumbnail(post.image, geometry, **options))
+        except Exception:
+            if settings.THUMBNAIL_DEBUG:
+                raise
+            logger.exception('Не удалось получить миниатюру %s',
+                             post.image.name)
+    return context
@@ -0,0 +1,197 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from ..cache import (cache_by_generation, card_key, get_stats, invalidate,
+                     render_cards, reset_stats)
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostCardCacheTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='tester',
+                                            first_name='Иван')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(author=cls.user, group=cls.group,
+                                       text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def load_post(self):
+        return Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk)
+
+    def test_card_key_follows_group_and_author(self):
+        """Ключ карточки меняется при правке группы и имени автора."""
+        key = card_key(self.load_post())
+        Group.objects.filter(pk=self.group.pk).update(title='Новая')
+        group_key = card_key(self.load_post())
+        User.objects.filter(pk=self.user.pk).update(first_name='Пётр')
+        author_key = card_key(self.load_post())
+        self.assertEqual(len({key, group_key, author_key}), 3)
+
+    def test_cards_come_from_one_get_many(self):
+        """Закешированные карточки собираются без повторного рендера."""
+        post = self.load_post()
+        first = render_cards([post])
+        cache.set(card_key(post), 'из кеша')
+        self.assertEqual(render_cards([post]), ['из кеша'])
+        self.assertIn('Тестовый пост', first[0])
+
+    def test_pages_render_cards(self):
+        """Списки постов показывают карточки из фрагментного кеша."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Тестовый пост')
+                self.assertContains(response, 'Иван')
+
+
+class FollowFeedCacheTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.stranger = User.objects.create_user(username='stranger')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author, text='Первый')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.url = reverse('posts:follow_index')
+
+    def test_feed_page_is_cached(self):
+        """Лента подписок отдаётся из кеша, пока данные не менялись."""
+        response = self.authorized_client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        cached = self.authorized_client.get(self.url)
+        self.assertEqual(response.content, cached.content)
+
+    def test_followed_author_post_invalidates_feed(self):
+        """Новый пост автора из подписок сбрасывает кеш ленты."""
+        self.authorized_client.get(self.url)
+        Post.objects.create(author=self.author, text='Второй')
+        response = self.authorized_client.get(self.url)
+        self.assertContains(response, 'Второй')
+
+    def test_author_post_invalidates_every_reader(self):
+        """Пост автора сбрасывает ленты всех его подписчиков."""
+        other = User.objects.create_user(username='other_reader')
+        Follow.objects.create(user=other, author=self.author)
+        other_client = Client()
+        other_client.force_login(other)
+        for client in (self.authorized_client, other_client):
+            client.get(self.url)
+        Post.objects.create(author=self.author, text='Второй')
+        for client in (self.authorized_client, other_client):
+            self.assertContains(client.get(self.url), 'Второй')
+
+    def test_other_author_post_keeps_feed(self):
+        """Пост чужого автора не трогает кеш ленты читателя."""
+        response = self.authorized_client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        Post.objects.create(author=self.stranger, text='Чужой')
+        cached = self.authorized_client.get(self.url)
+        self.assertEqual(response.content, cached.content)
+
+    def test_follow_invalidates_feed(self):
+        """Подписка сбрасывает кеш ленты подписчика."""
+        Post.objects.create(author=self.stranger, text='Чужой')
+        self.authorized_client.get(self.url)
+        Follow.objects.create(user=self.user, author=self.stranger)
+        response = self.authorized_client.get(self.url)
+        self.assertContains(response, 'Чужой')
+
+
+class StaleWhileRevalidateTest(SimpleTestCase):
+    concurrent_requests: int = 20
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.renders = 0
+        self.lock = threading.Lock()
+
+        @cache_by_generation(lambda: 'swr-test')
+        def view(request):
+            with self.lock:
+                self.renders += 1
+                number = self.renders
+            time.sleep(0.2)
+            return HttpResponse(f'версия {number}')
+
+        self.view = view
+
+    def get(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return self.view(request)
+
+    def fire(self):
+        barrier = threading.Barrier(self.concurrent_requests)
+        responses = []
+
+        def worker():
+            barrier.wait()
+            responses.append(self.get().content.decode())
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.concurrent_requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_expired_entry_is_rebuilt_once(self):
+        """Устаревшую страницу пересобирает один запрос, другие ждут старую."""
+        self.get()
+        invalidate('swr-test')
+        reset_stats()
+        responses = self.fire()
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(responses.count('версия 2'), 1)
+        self.assertEqual(responses.count('версия 1'),
+                         self.concurrent_requests - 1)
+        self.assertEqual(get_stats(), {
+            'hit': 0, 'stale': self.concurrent_requests - 1, 'miss': 1})
+        self.assertEqual(self.get().content.decode(), 'версия 2')
+
+    def test_cold_miss_is_coalesced(self):
+        """Пустой кеш заполняет один запрос, остальные дожидаются его."""
+        responses = self.fire()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(set(responses), {'версия 1'})
+        self.assertEqual(get_stats()['miss'], 1)
+
+    def test_hits_do_not_write_to_cache(self):
+        """Счётчики копятся в процессе и попадают в кеш только пачкой."""
+        for _ in range(10):
+            self.get()
+        self.assertIsNone(cache.get('page_cache_stats:hit'))
+        self.assertEqual(get_stats(), {'hit': 9, 'stale': 0, 'miss': 1})
+        self.assertEqual(cache.get('page_cache_stats:hit'), 9)
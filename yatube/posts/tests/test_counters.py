@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, Profile
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def profile(self, user):
+        return Profile.objects.get(user=user)
+
+    def test_post_counter(self):
+        """Счётчик постов автора растёт и уменьшается вместе с постами."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Ещё пост')
+        self.assertEqual(self.profile(self.author).posts_count, 2)
+        post.delete()
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка меняет счётчики подписчиков и подписок."""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.profile(self.author).followers_count, 1)
+        self.assertEqual(self.profile(self.user).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.profile(self.author).followers_count, 0)
+        self.assertEqual(self.profile(self.user).following_count, 0)
+
+    def test_comment_counter(self):
+        """Счётчик комментариев хранится в посте."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_profile_reads_counter_without_count_query(self):
+        """Профиль берёт число постов из счётчика, без COUNT(*)."""
+        Post.objects.create(author=self.author, text='Пост')
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(url)
+        self.assertEqual(response.context['counter'], 1)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет рассинхронизацию счётчиков."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        Profile.objects.update(posts_count=7)
+        Post.objects.update(comments_count=5)
+        call_command('recount', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,152 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import FeedEntry, Follow, Post, Profile
+
+User = get_user_model()
+
+
+class FeedTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def follow(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author}))
+
+    def feed_posts(self):
+        return list(FeedEntry.objects.filter(user=self.user).values_list(
+            'post_id', flat=True))
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка заполняет ленту, отписка очищает её."""
+        self.follow()
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author}))
+        self.assertEqual(self.feed_posts(), [])
+
+    def test_new_post_fans_out(self):
+        """Новый пост автора попадает в ленты подписчиков."""
+        self.follow()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.feed_posts(), [post.pk, self.old_post.pk])
+
+    def test_follow_index_reads_feed_without_follow_join(self):
+        """Лента подписок не соединяет посты с подписками."""
+        self.follow()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.old_post])
+        for query in queries.captured_queries:
+            self.assertFalse('posts_follow' in query['sql']
+                             and 'posts_post' in query['sql'])
+
+    def test_rebuild_feed_command(self):
+        """Команда rebuild_feed восстанавливает ленту по подпискам."""
+        Follow.objects.create(user=self.user, author=self.author)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feed', self.user.username, stdout=StringIO())
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+
+
+@override_settings(FEED_PULL_THRESHOLD=1, FEED_PUSH_THRESHOLD=2)
+class HybridFeedTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='reader')
+        cls.other_reader = User.objects.create_user(username='other')
+        cls.star = User.objects.create_user(username='star')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def finish_delivery(self):
+        out = StringIO()
+        call_command('feed_delivery', batch_size=1, stdout=out)
+        return out.getvalue()
+
+    def test_popular_author_switches_to_pull(self):
+        """Автор с большим числом подписчиков не пишется в ленты."""
+        before = Post.objects.create(author=self.star, text='До порога')
+        Follow.objects.create(user=self.user, author=self.star)
+        self.assertEqual(FeedEntry.objects.count(), 1)
+        Follow.objects.create(user=self.other_reader, author=self.star)
+        profile = Profile.objects.get(user=self.star)
+        self.assertTrue(profile.pull_delivery)
+        self.assertTrue(profile.delivery_pending)
+        after = Post.objects.create(author=self.star, text='После порога')
+        self.assertEqual(FeedEntry.objects.filter(author=self.star).count(),
+                         1)
+        self.assertEqual(self.feed(), [after, before])
+
+        self.assertIn('Перестроено авторов: 1', self.finish_delivery())
+        self.assertFalse(FeedEntry.objects.filter(author=self.star).exists())
+        self.assertFalse(
+            Profile.objects.get(user=self.star).delivery_pending)
+        cache.clear()
+        self.assertEqual(self.feed(), [after, before])
+
+    def test_feed_merges_push_and_pull_posts(self):
+        """Лента сливает посты pull-авторов с записями FeedEntry."""
+        Follow.objects.create(user=self.user, author=self.star)
+        Follow.objects.create(user=self.other_reader, author=self.star)
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate(
+                [self.star, self.author, self.star, self.author])
+        ]
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1])
+
+    def test_author_returns_to_push(self):
+        """После оттока подписчиков посты снова раскладываются по лентам."""
+        Follow.objects.create(user=self.user, author=self.star)
+        Follow.objects.create(user=self.other_reader, author=self.star)
+        post = Post.objects.create(author=self.star, text='Пост')
+        Follow.objects.filter(user=self.other_reader).delete()
+        self.assertFalse(Profile.objects.get(user=self.star).pull_delivery)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+        self.finish_delivery()
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertFalse(
+            Profile.objects.get(user=self.star).delivery_pending)
+        cache.clear()
+        self.assertEqual(self.feed(), [post])
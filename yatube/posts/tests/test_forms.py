@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -12,6 +13,7 @@ from ..models import Group, Post, Comment
 from django.core.cache import cache
 
 User = get_user_model()
+storage = Post._meta.get_field('image').storage
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -79,7 +81,8 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 text=form_data['text'],
                 group=form_data['group'],
-                image='posts/small.gif'
+                image=storage.content_name(
+                    'posts/small.gif', hashlib.sha256(small_gif).hexdigest())
             ).exists())
 
     def test_edit_post_authorized_user(self):
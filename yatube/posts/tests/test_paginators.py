@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Post
+from ..paginators import KeysetPaginator, decode_cursor, encode_cursor
+
+User = get_user_model()
+count_posts_for_tests: int = 25
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.user = User.objects.create_user(username='tester')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {i}')
+            for i in range(count_posts_for_tests)
+        )
+        cls.expected = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_cursor_round_trip(self):
+        """Курсор кодируется и декодируется без потерь."""
+        post = self.expected[0]
+        cursor = encode_cursor(post.pub_date, post.pk)
+        self.assertEqual(decode_cursor(cursor), (post.pub_date, post.pk))
+        self.assertIsNone(decode_cursor('мусор'))
+
+    def test_walk_older_and_newer(self):
+        """Переход по курсорам вперёд и назад даёт те же страницы."""
+        paginator = KeysetPaginator(Post.objects.all(), 10)
+        first = paginator.get_page(None)
+        second = KeysetPaginator(Post.objects.all(), 10).get_page(
+            2, after=first.next_cursor)
+        third = KeysetPaginator(Post.objects.all(), 10).get_page(
+            3, after=second.next_cursor)
+        self.assertEqual(list(first), self.expected[:10])
+        self.assertEqual(list(second), self.expected[10:20])
+        self.assertEqual(list(third), self.expected[20:])
+        self.assertFalse(third.has_next())
+        back = KeysetPaginator(Post.objects.all(), 10).get_page(
+            2, before=third.previous_cursor)
+        self.assertEqual(list(back), self.expected[10:20])
+
+    def test_page_number_still_resolves(self):
+        """Старые ссылки ?page=N открывают нужную страницу."""
+        page = KeysetPaginator(Post.objects.all(), 10).get_page('2')
+        self.assertEqual(list(page), self.expected[10:20])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_no_count_query(self):
+        """Страница ленты не выполняет COUNT(*)."""
+        first = KeysetPaginator(Post.objects.all(), 10).get_page(None)
+        url = reverse('posts:index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f'{url}?page=2&after={first.next_cursor}')
+        self.assertEqual(list(response.context['page_obj']),
+                         self.expected[10:20])
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import get_resolver, reverse
+
+from core.queries import QueryCounter
+from ..models import Comment, Follow, Group, Post
+from ..paginators import encode_cursor
+from ..thumbnails import generate
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def small_gif(shade):
+    """GIF 2×1; shade меняет палитру, чтобы файлы не совпадали."""
+    return (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00' + bytes([shade]) + b'\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+
+def posts_urls():
+    for pattern in get_resolver().url_patterns:
+        if getattr(pattern, 'app_name', None) == 'posts':
+            yield from pattern.url_patterns
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTest(TestCase):
+    """Каждая вьюха posts укладывается в бюджет на заполненной базе."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # В кеше sorl могут остаться ключи миниатюр от других тестов.
+        cache.clear()
+
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{number}',
+                                                first_name='Автор',
+                                                last_name=str(number))
+                       for number in range(3)]
+        cls.groups = [Group.objects.create(title=f'Группа {number}',
+                                           slug=f'group-{number}')
+                      for number in range(2)]
+        for number in range(30):
+            image = ''
+            if number % 5 == 0:
+                image = SimpleUploadedFile(f'small{number}.gif',
+                                           small_gif(number),
+                                           content_type='image/gif')
+            cls.post = Post.objects.create(
+                author=cls.authors[number % 3],
+                group=cls.groups[number % 2] if number % 4 else None,
+                text=f'Пост номер {number}',
+                image=image,
+            )
+            if image:
+                # Как воркер после коммита: миниатюры и варианты готовы.
+                generate(cls.post.image.name)
+        for number in range(25):
+            Comment.objects.create(post=cls.post,
+                                   author=cls.authors[number % 3],
+                                   text=f'Комментарий {number}')
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.post.author)
+
+    def requests(self):
+        """Пары (имя URL, ответ) на каждую вьюху, в том числе POST."""
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        author = self.post.author.username
+        other = self.authors[2].username
+        for name, kwargs in (
+                ('index', {}),
+                ('group_list', {'slug': self.groups[1].slug}),
+                ('profile', {'username': author}),
+                ('follow_index', {})):
+            url = reverse(f'posts:{name}', kwargs=kwargs)
+            yield name, self.client.get(url)
+            yield name, self.client.get(url, {'after': cursor})
+        post_url = reverse('posts:post_detail', args=[self.post.pk])
+        yield 'post_detail', self.client.get(post_url)
+        yield 'post_comments', self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'format': 'json'})
+        yield 'search', self.client.get(reverse('posts:search'),
+                                        {'q': 'Пост'})
+        yield 'add_comment', self.client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Новый комментарий'})
+        yield 'post_create', self.client.get(reverse('posts:post_create'))
+        yield 'post_create', self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Новый пост', 'group': self.groups[0].pk})
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        yield 'post_edit', self.author_client.get(edit_url)
+        yield 'post_edit', self.author_client.post(
+            edit_url, {'text': 'Правка', 'group': self.groups[0].pk})
+        yield 'profile_follow', self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': other}))
+        yield 'profile_unfollow', self.client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': other}))
+
+    def test_every_view_has_budget(self):
+        """У каждого URL из posts.urls есть бюджет запросов."""
+        for url in posts_urls():
+            with self.subTest(name=url.name):
+                self.assertIsInstance(
+                    getattr(url.callback, 'query_budget', None), int)
+
+    def test_views_within_budget(self):
+        """Вьюхи не превышают бюджет и не делают запросы в цикле."""
+        names = set()
+        for name, response in self.requests():
+            names.add(name)
+            with self.subTest(name=name):
+                self.assertLess(response.status_code, 400)
+        self.assertEqual(names, {url.name for url in posts_urls()})
+
+    def test_comment_page_has_no_repeated_queries(self):
+        """Двадцать комментариев читаются без запроса на каждый."""
+        counter = QueryCounter()
+        with counter.capture():
+            self.client.get(reverse('posts:post_detail',
+                                    args=[self.post.pk]))
+        self.assertEqual(counter.repeated(), [])
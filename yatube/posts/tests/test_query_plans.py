@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..paginators import encode_cursor
+
+User = get_user_model()
+
+
+def bad_steps(sql):
+    """Шаги плана запроса с полным проходом таблицы или сортировкой."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        steps = [row[-1] for row in cursor.fetchall()]
+    return [step for step in steps
+            if 'TEMP B-TREE' in step
+            or step.startswith('SCAN') and ' USING ' not in step
+            and 'VIRTUAL TABLE' not in step]
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент и страниц поста читают таблицы только по индексам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        for number in range(15):
+            cls.post = Post.objects.create(author=cls.author,
+                                           group=cls.group,
+                                           text=f'Пост {number}')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def urls(self):
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        lists = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        )
+        for url in lists:
+            yield url
+            yield f'{url}?after={cursor}'
+            yield f'{url}?before={cursor}'
+        yield reverse('posts:post_detail', args=[self.post.pk])
+        yield reverse('posts:post_comments', args=[self.post.pk])
+        yield reverse('posts:search') + '?q=Пост'
+        yield reverse('posts:profile_follow',
+                      kwargs={'username': self.author})
+
+    def test_no_full_scans_or_temp_sorts(self):
+        """Ни один SELECT страниц не сканирует таблицу и не сортирует."""
+        for url in self.urls():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                with self.subTest(url=url, sql=query['sql']):
+                    self.assertEqual(bad_steps(query['sql']), [])
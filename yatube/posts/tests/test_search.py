@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import filter_matching, search_posts
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query, per_page=10):
+        return [result.post.text
+                for result in search_posts(query, per_page).results]
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при создании, правке и удалении поста"""
+        post = Post.objects.create(author=self.user, text='Рыжий кот')
+        self.assertEqual(self.found('кот'), ['Рыжий кот'])
+        Post.objects.filter(pk=post.pk).update(text='Рыжая собака')
+        self.assertEqual(self.found('кот'), [])
+        self.assertEqual(self.found('собак'), ['Рыжая собака'])
+        post.delete()
+        self.assertEqual(self.found('собака'), [])
+
+    def test_ranking_and_snippet(self):
+        """Лучшее совпадение первое, фрагмент подсвечен и экранирован"""
+        Post.objects.create(author=self.user,
+                            text='<b>кот</b> и много других слов о жизни')
+        Post.objects.create(author=self.user, text='кот кот кот')
+        results = search_posts('кот', 10).results
+        self.assertEqual(results[0].post.text, 'кот кот кот')
+        self.assertIn('&lt;b&gt;<mark>кот</mark>&lt;/b&gt;',
+                      results[1].snippet)
+
+    def test_cursor_pages(self):
+        """Курсор отдаёт следующую страницу без повторов"""
+        for number in range(5):
+            Post.objects.create(author=self.user, text=f'слово {number}')
+        first = search_posts('слово', 3)
+        second = search_posts('слово', 3, first.next_cursor)
+        texts = [result.post.text for result in first.results
+                 + second.results]
+        self.assertEqual(len(set(texts)), 5)
+        self.assertIsNone(second.next_cursor)
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 во вводе не ломают запрос"""
+        Post.objects.create(author=self.user, text='кот')
+        self.assertEqual(self.found('кот" OR NEAR('), [])
+        self.assertEqual(self.found('***'), [])
+
+    def test_search_view(self):
+        """Страница поиска показывает найденные посты"""
+        Post.objects.create(author=self.user, text='Поиск по записям')
+        response = self.client.get(reverse('posts:search'), {'q': 'записям'})
+        self.assertContains(response, '<mark>записям</mark>')
+
+    def test_search_index_command(self):
+        """Команда заполняет индекс для уже существующих постов"""
+        Post.objects.create(author=self.user, text='старый пост')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts (posts_post_fts) "
+                "VALUES ('delete-all')")
+        self.assertEqual(self.found('старый'), [])
+        call_command('search_index', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.found('старый'), ['старый пост'])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по индексу"""
+        Post.objects.create(author=self.user, text='первый')
+        Post.objects.create(author=self.user, text='второй')
+        self.assertQuerysetEqual(
+            filter_matching(Post.objects.all(), 'перв'), ['первый'],
+            transform=lambda post: post.text)
+        request = RequestFactory().get('/')
+        queryset, _ = site._registry[Post].get_search_results(
+            request, Post.objects.all(), 'второй')
+        self.assertEqual([post.text for post in queryset], ['второй'])
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ..models import AuthorShard, Comment, Follow, Post, Profile
+from ..shards import ShardRouter, author_shard, hash_shard
+
+User = get_user_model()
+usernames = (f'author{number}' for number in count())
+
+
+@override_settings(POST_SHARDS=['default', 'shard'])
+class ShardingTest(TransactionTestCase):
+    """Второй шард — файл SQLite, схему в нём создаёт migrate."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        connections.databases['shard'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'shard.sqlite3'),
+        }
+        connections.ensure_defaults('shard')
+        connections.prepare_test_settings('shard')
+        call_command('migrate', database='shard', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['shard'].close()
+        del connections['shard']
+        del connections.databases['shard']
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(call_command, 'flush', database='shard',
+                        interactive=False, verbosity=0)
+
+    def author_on(self, alias):
+        """Новый автор, которого хеш кладёт в шард alias."""
+        while True:
+            user = User.objects.create_user(username=next(usernames))
+            if hash_shard(user.pk) == alias:
+                return user
+
+    def test_new_author_placed_by_hash(self):
+        """Первый пост нового автора ложится в шард по хешу."""
+        author = self.author_on('shard')
+        post = Post.objects.create(author=author, text='Пост')
+        self.assertEqual(post._state.db, 'shard')
+        self.assertTrue(Post.objects.using('shard').filter(pk=post.pk)
+                        .exists())
+        self.assertFalse(Post.objects.using('default').filter(pk=post.pk)
+                         .exists())
+        self.assertEqual(AuthorShard.objects.get(author=author).alias,
+                         'shard')
+        self.assertEqual(Profile.objects.get(user=author).posts_count, 1)
+
+    def test_author_from_before_sharding_stays_home(self):
+        """Автор с постами в первом шарде остаётся в нём."""
+        author = self.author_on('shard')
+        with override_settings(POST_SHARDS=['default']):
+            Post.objects.create(author=author, text='Старый пост')
+        post = Post.objects.create(author=author, text='Новый пост')
+        self.assertEqual(post._state.db, 'default')
+        self.assertEqual(author_shard(author.pk), 'default')
+
+    def test_ids_are_unique_across_shards(self):
+        """id выдаёт общий счётчик, а не автоинкремент шарда."""
+        with override_settings(POST_SHARDS=['default']):
+            legacy = Post.objects.create(author=self.author_on('default'),
+                                         text='Старый пост')
+        first = Post.objects.create(author=self.author_on('shard'),
+                                    text='Первый')
+        second = Post.objects.create(author=self.author_on('default'),
+                                     text='Второй')
+        self.assertEqual([first.pk, second.pk],
+                         [legacy.pk + 1, legacy.pk + 2])
+
+    def test_router(self):
+        """Пост и его комментарии читаются из шарда автора."""
+        router = ShardRouter()
+        author = self.author_on('shard')
+        post = Post.objects.create(author=author, text='Пост')
+        self.assertEqual(router.db_for_read(Post, instance=author), 'shard')
+        self.assertEqual(router.db_for_read(Comment, instance=post), 'shard')
+        self.assertEqual(router.db_for_write(Comment, instance=Comment(
+            post=post, author=author)), 'shard')
+        self.assertIsNone(router.db_for_read(Post))
+        self.assertIsNone(router.db_for_read(User, instance=post))
+
+    def test_pages_read_all_shards(self):
+        """Общая лента сливает шарды по дате, страницы поста — из шарда."""
+        authors = [self.author_on('default'), self.author_on('shard')]
+        posts = [Post.objects.create(author=authors[number % 2],
+                                     text=f'Пост {number}')
+                 for number in range(12)]
+        client = Client()
+        response = client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertEqual(list(page), posts[:-11:-1])
+        response = client.get(reverse('posts:index'),
+                              {'after': page.next_cursor})
+        self.assertEqual(list(response.context['page_obj']), posts[1::-1])
+
+        response = client.get(reverse('posts:profile',
+                                      kwargs={'username': authors[1]}))
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[-1::-2])
+
+        client.force_login(authors[0])
+        post = posts[-1]
+        client.post(reverse('posts:add_comment', args=[post.pk]),
+                    {'text': 'Комментарий'})
+        comment = Comment.objects.using('shard').get(post=post)
+        self.assertEqual(comment.author, authors[0])
+        response = client.get(reverse('posts:post_detail', args=[post.pk]))
+        self.assertContains(response, 'Комментарий')
+        self.assertEqual(response.context['post'].comments_count, 1)
+
+    def test_reshard_moves_author(self):
+        """reshard переносит посты и комментарии, не трогая счётчики."""
+        author = self.author_on('shard')
+        reader = self.author_on('default')
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(author=author, text='Пост')
+        Comment.objects.create(post=post, author=reader, text='Комментарий')
+
+        call_command('reshard', author.username, to='default',
+                     stdout=StringIO())
+
+        self.assertEqual(author_shard(author.pk), 'default')
+        self.assertFalse(Post.objects.using('shard').exists())
+        self.assertFalse(Comment.objects.using('shard').exists())
+        moved = Post.objects.using('default').get(pk=post.pk)
+        self.assertEqual(moved.comments_count, 1)
+        self.assertEqual(Profile.objects.get(user=author).posts_count, 1)
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [moved])
+        self.assertContains(client.get(reverse('posts:search'),
+                                       {'q': 'Пост'}), 'Пост')
+
+        out = StringIO()
+        call_command('reshard', stdout=out)
+        self.assertIn('Перенесено авторов: 1', out.getvalue())
+        self.assertEqual(author_shard(author.pk), 'shard')
+        self.assertTrue(Comment.objects.using('shard').filter(
+            post=post).exists())
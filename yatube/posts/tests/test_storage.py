@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ..models import MediaBlob, Post
+from ..storage import is_content_name
+from ..thumbnails import generate
+from .test_thumbnails import png
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+storage = Post._meta.get_field('image').storage
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='keeper')
+
+    def test_name_is_sharded_hash(self):
+        """Файл называется хешем содержимого и лежит в подкаталогах"""
+        name = storage.save('posts/photo.JPG', ContentFile(b'data'))
+        digest = hashlib.sha256(b'data').hexdigest()
+        self.assertEqual(name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertTrue(is_content_name(name))
+        self.assertTrue(storage.exists(name))
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки хранятся один раз, со счётчиком ссылок"""
+        first = storage.save('posts/a.png', ContentFile(b'same'))
+        second = storage.save('posts/b.png', ContentFile(b'same'))
+        self.assertEqual(first, second)
+        self.assertEqual(MediaBlob.objects.get(name=first).refs, 2)
+        storage.release(first)
+        self.assertTrue(storage.exists(first))
+        storage.release(first)
+        self.assertFalse(storage.exists(first))
+        self.assertFalse(MediaBlob.objects.filter(name=first).exists())
+
+    def test_last_release_unlinks_inside_transaction(self):
+        """Файл стирается до коммита: сбой откатывает удаление записи"""
+        name = storage.save('posts/c.png', ContentFile(b'locked'))
+        with mock.patch('django.core.files.storage.FileSystemStorage.delete',
+                        side_effect=OSError):
+            with self.assertRaises(OSError):
+                storage.release(name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        self.assertTrue(storage.exists(name))
+
+    def test_migrate_media(self):
+        """Команда переносит старые файлы и продолжает с места остановки"""
+        legacy = os.path.join(TEMP_MEDIA_ROOT, 'posts')
+        os.makedirs(legacy, exist_ok=True)
+        for number in range(3):
+            with open(os.path.join(legacy, f'{number}.gif'), 'wb') as file:
+                file.write(b'same' if number < 2 else b'other')
+        Post.objects.bulk_create(
+            Post(author=self.user, text=str(number),
+                 image=f'posts/{number}.gif') for number in range(3))
+        Post.objects.create(author=self.user, text='пропавший',
+                            image='posts/missing.gif')
+        out = StringIO()
+        call_command('migrate_media', batch_size=2, stdout=out)
+        self.assertIn('Перенесено картинок: 3, не найдено: 1',
+                      out.getvalue())
+        names = [Post.objects.get(text=str(number)).image.name
+                 for number in range(3)]
+        self.assertTrue(all(is_content_name(name) for name in names))
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(MediaBlob.objects.get(name=names[0]).refs, 2)
+        self.assertFalse(os.path.exists(os.path.join(legacy, '0.gif')))
+        out = StringIO()
+        call_command('migrate_media', stdout=out)
+        self.assertIn('Перенесено картинок: 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageReplaceTest(TransactionTestCase):
+    """Ссылки снимаются после коммита, поэтому нужны настоящие транзакции."""
+
+    def test_same_bytes_keep_one_reference(self):
+        """Замена картинки теми же байтами не оставляет лишней ссылки"""
+        user = User.objects.create_user(username='replacer')
+        post = Post.objects.create(
+            author=user, text='Пост',
+            image=SimpleUploadedFile('a.png', png(4, 4), 'image/png'))
+        name = post.image.name
+        post.image = SimpleUploadedFile('b.png', png(4, 4), 'image/png')
+        post.save()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        post.text = 'Правка'
+        post.save()
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        post.delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=TEMP_MEDIA_ROOT),
+                   THUMBNAIL_WORKERS=0)
+class CollectMediaTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='collector')
+
+    def setUp(self):
+        cache.clear()
+        self.live = Post.objects.create(
+            author=self.user, text='живой',
+            image=SimpleUploadedFile('live.png', png(120, 60)))
+        generate(self.live.image.name)
+        self.live_files = set(self.files())
+        dead = Post.objects.create(
+            author=self.user, text='удалённый',
+            image=SimpleUploadedFile('dead.png', png(130, 60)))
+        generate(dead.image.name)
+        dead.delete()
+        MediaBlob.objects.filter(name=dead.image.name).delete()
+        self.write('posts/legacy.gif', b'x' * 100)
+        self.dead_files = set(self.files()) - self.live_files
+        old = time.time() - 2 * 24 * 60 * 60
+        for name in self.files():
+            os.utime(os.path.join(settings.MEDIA_ROOT, name), (old, old))
+        self.write('posts/fresh.gif', b'y')
+
+    def write(self, name, content):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+
+    def files(self, root=None):
+        root = root or settings.MEDIA_ROOT
+        return [os.path.relpath(os.path.join(path, name), root)
+                for path, _, names in os.walk(root) for name in names]
+
+    def size(self, names):
+        return sum(os.path.getsize(os.path.join(settings.MEDIA_ROOT, name))
+                   for name in names)
+
+    def test_orphans_are_deleted(self):
+        """Удаляются сироты старше льготного срока, остальное на месте"""
+        self.assertEqual(
+            {name.split('/')[0] for name in self.dead_files},
+            {'posts', 'variants', 'cache'})
+        reclaimed = self.size(self.dead_files)
+        out = StringIO()
+        call_command('collect_media', batch_size=2, stdout=out)
+        self.assertIn(f'Удалено файлов: {len(self.dead_files)}, '
+                      f'{reclaimed} байт', out.getvalue())
+        self.assertEqual(set(self.files()),
+                         self.live_files | {'posts/fresh.gif'})
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img')
+
+    def test_dry_run_and_quarantine(self):
+        """--dry-run ничего не трогает, --quarantine переносит файлы"""
+        before = set(self.files())
+        out = StringIO()
+        call_command('collect_media', dry_run=True, stdout=out)
+        self.assertIn(f'Найдено файлов: {len(self.dead_files)}',
+                      out.getvalue())
+        self.assertEqual(set(self.files()), before)
+        quarantine = tempfile.mkdtemp(dir=TEMP_MEDIA_ROOT)
+        call_command('collect_media', quarantine=quarantine,
+                     stdout=StringIO())
+        self.assertEqual(set(self.files(quarantine)), self.dead_files)
+        self.assertEqual(set(self.files()), before - self.dead_files)
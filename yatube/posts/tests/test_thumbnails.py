@@ -0,0 +1,243 @@
+import io
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from ..models import Post
+from ..thumbnails import (generate, pending_names, prefetch_thumbnails,
+                          thumbnail_specs)
+from ..variants import build_variants, supported_formats
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class EagerThumbnailTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'))
+
+    def test_placeholder_until_ready(self):
+        """Пока миниатюра режется, на странице заглушка"""
+        self.assertEqual(pending_names([self.post.image.name]),
+                         {self.post.image.name})
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Картинка обрабатывается')
+        self.assertNotContains(response, '<img class="card-img')
+
+    def test_generate_replaces_placeholder(self):
+        """После нарезки страницы показывают готовую миниатюру"""
+        self.client.get(reverse('posts:index'))
+        generate(self.post.image.name)
+        self.assertEqual(pending_names([self.post.image.name]), set())
+        thumbnails = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertTrue(any(files for _, _, files in os.walk(thumbnails)))
+        for url in (reverse('posts:index'),
+                    reverse('posts:post_detail', args=[self.post.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, '<img class="card-img')
+                self.assertNotContains(response, 'Картинка обрабатывается')
+
+    def test_unchanged_image_is_not_rescheduled(self):
+        """Правка текста не ставит картинку в очередь заново"""
+        cache.clear()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertEqual(pending_names([self.post.image.name]), set())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageVariantTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='illustrator')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с большой картинкой',
+            image=SimpleUploadedFile('big.png', png(1200, 300), 'image/png'))
+
+    def test_variants_cover_widths_without_upscaling(self):
+        """Варианты режутся по ширинам, но не шире исходника"""
+        variants = build_variants(self.post)
+        widths = sorted({variant.width for variant in variants})
+        self.assertEqual(widths, [480, 960, 1200])
+        self.assertEqual({variant.format for variant in variants},
+                         set(supported_formats()))
+        for variant in variants:
+            self.assertTrue(default_storage.exists(variant.file.name))
+
+    def test_picture_uses_variants(self):
+        """Карточка поста отдаёт <picture> со srcset вариантов"""
+        generate(self.post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '-480.webp 480w')
+
+    def test_shared_source_keeps_variants(self):
+        """Замена картинки не стирает варианты поста с теми же байтами"""
+        twin = Post.objects.create(
+            author=self.user, text='Та же картинка',
+            image=SimpleUploadedFile('copy.png', png(1200, 300), 'image/png'))
+        self.assertEqual(twin.image.name, self.post.image.name)
+        build_variants(self.post)
+        shared = build_variants(twin)
+        self.post.image = SimpleUploadedFile('new.png', png(1000, 300),
+                                             'image/png')
+        self.post.save()
+        build_variants(self.post)
+        for variant in shared:
+            self.assertTrue(default_storage.exists(variant.file.name))
+
+    def test_backfill_command(self):
+        """Команда нарезает варианты для постов без них"""
+        call_command('image_variants', workers=0, stdout=StringIO())
+        self.assertTrue(self.post.image_variants.exists())
+        out = StringIO()
+        call_command('image_variants', workers=0, stdout=out)
+        self.assertIn('Нарезано картинок: 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailStoreTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='archivist')
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {number}',
+                image=SimpleUploadedFile(f'{number}.png',
+                                         png(100 + number, 50), 'image/png'))
+            for number in range(3)
+        ]
+        for post in self.posts:
+            generate(post.image.name)
+        cache.clear()
+
+    def test_prefetch_thumbnails_in_one_query(self):
+        """Миниатюры страницы находятся одним запросом к хранилищу"""
+        with self.assertNumQueries(1):
+            prefetch_thumbnails(self.posts)
+        geometry, options = thumbnail_specs[0]
+        for post in self.posts:
+            self.assertEqual(
+                post.thumbnail_image.name,
+                get_thumbnail(post.image, geometry, **options).name)
+
+    def test_cached_thumbnails_need_no_queries(self):
+        """Повторный поиск миниатюр обходится кешем"""
+        prefetch_thumbnails(self.posts)
+        with self.assertNumQueries(0):
+            prefetch_thumbnails(self.posts)
+
+    def test_prune_removes_stale_entries(self):
+        """Команда удаляет записи о пропавших файлах"""
+        post = self.posts[0]
+        geometry, options = thumbnail_specs[0]
+        thumbnail = get_thumbnail(post.image, geometry, **options)
+        default_storage.delete(thumbnail.name)
+        out = StringIO()
+        call_command('prune_thumbnails', batch_size=1, stdout=out)
+        self.assertIn('Удалено записей о файлах: 1, списков миниатюр: 1',
+                      out.getvalue())
+        prefetch_thumbnails(self.posts)
+        self.assertFalse(hasattr(post, 'thumbnail_image'))
+        self.assertTrue(hasattr(self.posts[1], 'thumbnail_image'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageMetadataTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='surveyor')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('wide.png', png(400, 100), 'image/png'))
+
+    def test_dimensions_filled_at_upload(self):
+        """Размеры и заглушка записываются при загрузке"""
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (400, 100))
+        self.assertTrue(self.post.image_placeholder.startswith(
+            'data:image/jpeg;base64,'))
+        with default_storage.open(self.post.image.name) as file:
+            self.assertEqual(file.read(), png(400, 100))
+
+    def test_lazy_image_with_dimensions(self):
+        """Картинка грузится лениво, с размерами и заглушкой"""
+        generate(self.post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'width="960" height="240"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'url(data:image/jpeg;base64,')
+
+    def test_removed_image_clears_fields(self):
+        """Без картинки поля размеров очищаются"""
+        self.post.image = None
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertIsNone(self.post.image_width)
+        self.assertEqual(self.post.image_placeholder, '')
+
+    def test_backfill_command(self):
+        """Команда описывает картинки, загруженные раньше"""
+        Post.objects.update(image_width=None, image_height=None,
+                            image_placeholder='')
+        call_command('image_metadata', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_height, 100)
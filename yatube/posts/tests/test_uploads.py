@@ -0,0 +1,125 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from .. import uploads
+from ..forms import PostForm
+from ..models import Post
+from ..uploads import process_upload
+from .test_thumbnails import png
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+def rotated_jpeg():
+    """JPEG 40x20 с тегом Orientation=6: показывается как 20x40."""
+    image = Image.new('RGB', (40, 20), (10, 120, 200))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = 'Камера'
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, UPLOAD_WORKERS=0)
+class UploadProcessingTest(TestCase):
+
+    def form(self, name, content):
+        return PostForm({'text': 'Текст'},
+                        {'image': SimpleUploadedFile(name, content)})
+
+    def test_orientation_applied_and_exif_stripped(self):
+        """Картинка поворачивается по EXIF и теряет метаданные"""
+        form = self.form('photo.jpeg', rotated_jpeg())
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'photo.jpg')
+        saved = Image.open(io.BytesIO(image.read()))
+        self.assertEqual(saved.size, (20, 40))
+        self.assertEqual(dict(saved.getexif()), {})
+
+    def test_description_comes_from_worker(self):
+        """Размеры и заглушку считает воркер, сохранение их не пересчитывает"""
+        user = User.objects.create_user(username='describer')
+        form = self.form('photo.jpeg', rotated_jpeg())
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = user
+        with mock.patch('posts.variants._describe') as describe:
+            post.save()
+        describe.assert_not_called()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (20, 40))
+        self.assertTrue(post.image_placeholder.startswith(
+            'data:image/jpeg;base64,'))
+
+    def test_pixel_limit_is_not_global(self):
+        """Предел пикселей загрузок не меняет глобальный предел Pillow"""
+        default = Image.MAX_IMAGE_PIXELS
+        with self.settings(UPLOAD_MAX_PIXELS=100):
+            form = self.form('big.png', png(20, 20))
+            self.assertTrue(form.has_error('image', code='too_large'))
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, default)
+
+    def test_rejected_uploads(self):
+        """Битые, чужие и слишком большие файлы отклоняются"""
+        bmp = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(bmp, 'BMP')
+        # Не-картинки отсекает ещё ImageField по заголовку.
+        cases = (
+            ('broken.png', png(10, 10)[:40], 'invalid_image'),
+            ('text.png', b'not an image', 'invalid_image'),
+            ('old.bmp', bmp.getvalue(), 'format'),
+        )
+        for name, content, code in cases:
+            with self.subTest(name=name):
+                form = self.form(name, content)
+                self.assertTrue(form.has_error('image', code=code))
+        with self.settings(UPLOAD_MAX_PIXELS=100):
+            form = self.form('big.png', png(20, 20))
+            self.assertTrue(form.has_error('image', code='too_large'))
+        with self.settings(UPLOAD_MAX_BYTES=10):
+            form = self.form('heavy.png', png(20, 20))
+            self.assertTrue(form.has_error('image', code='too_large'))
+        self.assertEqual(uploads.process(b'not an image', 1000).error,
+                         'invalid')
+
+    @override_settings(UPLOAD_WORKERS=1)
+    def test_pool_returns_result(self):
+        """Пул процессов возвращает проверенную картинку"""
+        uploads.shutdown()
+        self.addCleanup(uploads.shutdown)
+        result = process_upload(png(30, 10))
+        self.assertIsNone(result.error)
+        self.assertEqual((result.format, result.width, result.height),
+                         ('PNG', 30, 10))
+
+    @override_settings(UPLOAD_WORKERS=1, UPLOAD_QUEUE_SIZE=0,
+                       UPLOAD_TIMEOUT=0.01)
+    def test_saturated_pool_answers_503(self):
+        """Переполненный пул — 503 с Retry-After, пост не создаётся"""
+        uploads.shutdown()
+        self.addCleanup(uploads.shutdown)
+        user = User.objects.create_user(username='uploader')
+        self.client.force_login(user)
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Подождёт',
+            'image': SimpleUploadedFile('wait.png', png(10, 10)),
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Post.objects.filter(text='Подождёт').exists())
@@ -4,7 +4,7 @@ from django.test import Client, TestCase
 from django.urls import reverse
 from django.core.cache import cache
 from http import HTTPStatus
-from ..models import Follow, Group, Post
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 count_posts_for_tests: int = 13
@@ -143,7 +143,7 @@ class PostsPagesTests(TestCase):
         )
         response = self.authorized_client.get(reverse('posts:index'))
         self.check_context_page_or_post(context=response.context)
-        Post.objects.filter(id=self.post.pk).delete()
+        Post.objects.filter(id=self.post.pk).update(text='Без сигналов')
         cached_response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, cached_response.content)
         cache.clear()
@@ -152,6 +152,51 @@ class PostsPagesTests(TestCase):
         self.assertNotEqual(cached_response.content,
                             after_clear_response.content)
 
+    def test_index_cache_invalidated_by_post_change(self):
+        """Удаление поста сбрасывает кеш главной страницы."""
+        post = Post.objects.create(text='Пост для удаления', author=self.user)
+        response = self.guest_client.get(reverse('posts:index'))
+        post.delete()
+        fresh_response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotEqual(response.content, fresh_response.content)
+
+    def test_group_change_invalidates_pages(self):
+        """Правка группы сбрасывает главную, группу и профиль автора."""
+        urls = [reverse('posts:index'),
+                reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+                reverse('posts:profile', kwargs={'username': 'tester'})]
+        for url in urls:
+            self.guest_client.get(url)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Переименованная группа'
+        group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url),
+                                    'Переименованная группа')
+
+    def test_author_name_change_invalidates_pages(self):
+        """Смена имени автора видна на главной, в группе и профиле."""
+        urls = [reverse('posts:index'),
+                reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+                reverse('posts:profile', kwargs={'username': 'tester'})]
+        for url in urls:
+            self.guest_client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Переименованный'
+        user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url),
+                                    'Переименованный')
+
+    def test_first_page_aliases_share_cache(self):
+        """?page=1 и страница без параметра — одна запись кеша."""
+        response = self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        aliased = self.guest_client.get(reverse('posts:index') + '?page=1')
+        self.assertEqual(response.content, aliased.content)
+
 
 class PaginatorViewsTest(TestCase):
 
@@ -205,6 +250,53 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']), 3)
 
 
+class CommentPaginationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_comments(self):
+        """На странице поста только первая порция комментариев"""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Комментарий 24')
+        self.assertIsNotNone(comments.next_url)
+
+    def test_comments_fragment(self):
+        """Фрагмент по курсору отдаёт оставшиеся комментарии"""
+        first = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        response = self.client.get(first.context['comments'].next_url)
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertContains(response, 'Комментарий 0')
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_comments_fragment_json(self):
+        """Фрагмент комментариев умеет отвечать JSON"""
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['comments']), 20)
+        self.assertEqual(data['comments'][0]['text'], 'Комментарий 24')
+        second = self.client.get(data['next'] + '&format=json').json()
+        self.assertEqual(len(second['comments']), 5)
+        self.assertIsNone(second['next'])
+
+
 class FollowTest(TestCase):
     @classmethod
     def setUpClass(cls):
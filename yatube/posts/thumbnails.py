@@ -0,0 +1,198 @@
+"""Миниатюры постов, нарезанные заранее в пуле процессов.
+
+Как только пост с новой картинкой записан в базу, её миниатюры всех
+размеров из thumbnail_specs и варианты для srcset (см. variants)
+режутся в отдельном процессе, а не в запросе первого читателя. Пока
+работа идёт, в кеше лежит флаг pending, и шаблоны показывают заглушку.
+Когда всё готово, процесс снимает флаг и сбрасывает страницы с постом.
+
+Очередь ограничена: если она полна, картинка нарезается по-старому,
+лениво, при первом показе.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+logger = logging.getLogger(__name__)
+
+thumbnail_specs = (
+    ('960x339', {'crop': '', 'upscale': True}),
+)
+pending_timeout: int = 60 * 10
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def workers():
+    return getattr(settings, 'THUMBNAIL_WORKERS', 2)
+
+
+def queue_size():
+    return getattr(settings, 'THUMBNAIL_QUEUE_SIZE', 32)
+
+
+def _pending_key(name):
+    return f'thumbnail_pending:{name}'
+
+
+def pending_names(names):
+    """Имена картинок из names, миниатюры которых ещё режутся."""
+    found = cache.get_many([_pending_key(name) for name in names])
+    return {name for name in names if _pending_key(name) in found}
+
+
+def init_worker():
+    django.setup()
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+            _slots = threading.BoundedSemaphore(queue_size())
+        return _executor
+
+
+def generate(name):
+    """Нарезает миниатюры и варианты картинки и сбрасывает страницы с ней."""
+    from .cache import invalidate, invalidate_feed_readers, post_scopes
+    from .models import Post
+    from .variants import build_variants
+
+    posts = [post for shard in Post.objects.on_shards()
+             for post in shard.filter(image=name)]
+    try:
+        for geometry, options in thumbnail_specs:
+            get_thumbnail(source_file(name), geometry, **options)
+        for post in posts:
+            build_variants(post)
+    finally:
+        cache.delete(_pending_key(name))
+        for post in posts:
+            invalidate(*post_scopes(post))
+            invalidate_feed_readers(post.author_id)
+
+
+def _submit(name):
+    if workers() == 0:
+        generate(name)
+        return
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        cache.delete(_pending_key(name))
+        return
+    try:
+        future = executor.submit(generate, name)
+    except RuntimeError:
+        _slots.release()
+        cache.delete(_pending_key(name))
+        logger.exception('Пул миниатюр недоступен')
+        return
+    future.add_done_callback(_finished)
+
+
+def _finished(future):
+    _slots.release()
+    if future.exception() is not None:
+        logger.error('Не удалось нарезать миниатюры',
+                     exc_info=future.exception())
+
+
+def schedule(name):
+    """Ставит нарезку в очередь после фиксации транзакции.
+
+    Флаг pending ставится сразу, чтобы страницы, собранные до конца
+    нарезки, показали заглушку; его срок жизни страхует от упавшего
+    процесса.
+    """
+    cache.set(_pending_key(name), True, pending_timeout)
+    transaction.on_commit(lambda: _submit(name))
+
+
+def source_file(name):
+    """Исходник для sorl в хранилище поля Post.image.
+
+    Хранилище входит в ключ sorl, поэтому миниатюра, нарезанная заранее,
+    найдётся шаблоном, только если исходник описан так же, как
+    post.image.
+    """
+    from .models import Post
+
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def thumbnail_file(name, geometry, options):
+    """ImageFile миниатюры с тем же именем, что даст get_thumbnail.
+
+    Повторяет слияние опций из ThumbnailBackend.get_thumbnail
+    (sorl-thumbnail 12.7), но не ходит ни в хранилище ключей, ни к файлам.
+    """
+    backend = default.backend
+    source = source_file(name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage)
+
+
+def prefetch_thumbnails(posts):
+    """Находит готовые миниатюры всех постов одним get_many.
+
+    Без этого sorl ищет каждую миниатюру в кеше, а при промахе в базе,
+    по запросу на тег. Найденная миниатюра кладётся в
+    post.thumbnail_image; остальные посты тег досчитает сам.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        return
+    geometry, options = thumbnail_specs[0]
+    keys = {}
+    for post in posts:
+        if post.image:
+            key = add_prefix(
+                thumbnail_file(post.image.name, geometry, options).key)
+            keys.setdefault(key, []).append(post)
+    if not keys:
+        return
+    found = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        if stored:
+            kvstore.cache.set_many(stored,
+                                   sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(stored)
+    for key, key_posts in keys.items():
+        value = found.get(key)
+        if isinstance(value, str) and value:
+            for post in key_posts:
+                post.thumbnail_image = deserialize_image_file(value)
@@ -0,0 +1,179 @@
+"""Проверка и нормализация загруженных картинок в пуле процессов.
+
+Pillow разбирает загрузку не в процессе веб-сервера, а в отдельном
+воркере: огромная или испорченная картинка не съест память и время
+запроса. Воркер читает заголовок и отказывает без декодирования, если
+формат не из allowed_formats или пикселей больше UPLOAD_MAX_PIXELS.
+Остальное декодируется, а картинки с EXIF поворачиваются по нему
+и пересохраняются без метаданных. Там же считаются размеры и LQIP-
+заглушка (см. posts.variants), чтобы сохранению поста не пришлось
+открывать картинку ещё раз.
+
+Очередь ограничена UPLOAD_QUEUE_SIZE картинками. Если за UPLOAD_TIMEOUT
+секунд место не освободилось или воркер не успел, вызывающий получает
+PoolBusy и может попросить пользователя повторить позже.
+"""
+import base64
+import io
+import multiprocessing
+import threading
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+allowed_formats = ('GIF', 'JPEG', 'PNG', 'WEBP')
+quality: int = 90
+placeholder_size = (16, 16)
+placeholder_quality: int = 40
+
+ProcessedImage = namedtuple(
+    'ProcessedImage',
+    ('error', 'content', 'format', 'width', 'height', 'placeholder'))
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+class PoolBusy(Exception):
+    """Пул не взял картинку или не обработал её за UPLOAD_TIMEOUT."""
+
+
+def workers():
+    return getattr(settings, 'UPLOAD_WORKERS', 2)
+
+
+def queue_size():
+    return getattr(settings, 'UPLOAD_QUEUE_SIZE', 8)
+
+
+def timeout():
+    return getattr(settings, 'UPLOAD_TIMEOUT', 10)
+
+
+def max_pixels():
+    return getattr(settings, 'UPLOAD_MAX_PIXELS', 6000 * 4000)
+
+
+def max_bytes():
+    return getattr(settings, 'UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+class ProcessedUpload(SimpleUploadedFile):
+    """Проверенная картинка вместе с размерами и заглушкой из воркера."""
+
+    def __init__(self, name, result):
+        super().__init__(name, result.content,
+                         f'image/{result.format.lower()}')
+        self.description = (result.width, result.height,
+                            result.placeholder)
+
+
+def placeholder(image):
+    """LQIP: крошечная JPEG-копия уже повёрнутой картинки в data URI."""
+    small = image.convert('RGB')
+    small.thumbnail(placeholder_size)
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=placeholder_quality)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def _failed(error):
+    return ProcessedImage(error, None, None, None, None, None)
+
+
+def process(data, pixels_limit):
+    """Проверяет и пересохраняет картинку; вызывается в воркере.
+
+    Пересохраняются только картинки с EXIF, остальные после полного
+    декодирования отдаются как есть. У анимированных декодируется
+    только первый кадр для заглушки: пересохранение кадр за кадром
+    дорогое, а EXIF в GIF не бывает.
+    """
+    with warnings.catch_warnings():
+        # Предел пикселей проверяется ниже по pixels_limit, а не по
+        # глобальному Image.MAX_IMAGE_PIXELS, общему с sorl и variants.
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.format not in allowed_formats:
+                return _failed('format')
+            width, height = image.size
+            if width * height > pixels_limit:
+                return _failed('too_large')
+            if getattr(image, 'is_animated', False):
+                return ProcessedImage(None, data, image.format, width,
+                                      height, placeholder(image))
+            image.load()
+            if 'exif' not in image.info:
+                return ProcessedImage(None, data, image.format, width,
+                                      height, placeholder(image))
+            normalized = ImageOps.exif_transpose(image)
+        except Image.DecompressionBombError:
+            return _failed('too_large')
+        except Exception:
+            return _failed('invalid')
+    normalized.info.pop('exif', None)
+    options = {'icc_profile': normalized.info.get('icc_profile')}
+    if image.format in ('JPEG', 'WEBP'):
+        options['quality'] = quality
+    if image.format == 'JPEG' and normalized.mode not in ('RGB', 'L'):
+        normalized = normalized.convert('RGB')
+    buffer = io.BytesIO()
+    normalized.save(buffer, image.format, **options)
+    return ProcessedImage(None, buffer.getvalue(), image.format,
+                          normalized.width, normalized.height,
+                          placeholder(normalized))
+
+
+def _get_executor():
+    """Пул процессов, общий для всех запросов; создаётся при первом вызове."""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _slots = threading.BoundedSemaphore(queue_size())
+        return _executor, _slots
+
+
+def shutdown():
+    """Останавливает пул; следующая загрузка создаст новый по настройкам."""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = _slots = None
+
+
+def process_upload(data):
+    """Обрабатывает байты картинки в пуле и возвращает ProcessedImage.
+
+    Ожидание места в очереди и работа воркера вместе укладываются
+    в UPLOAD_TIMEOUT; иначе — PoolBusy. Воркер, не успевший к сроку,
+    дорабатывает в фоне и только потом освобождает место.
+    """
+    if workers() == 0:
+        return process(data, max_pixels())
+    executor, slots = _get_executor()
+    deadline = time.monotonic() + timeout()
+    if not slots.acquire(timeout=timeout()):
+        raise PoolBusy
+    try:
+        future = executor.submit(process, data, max_pixels())
+    except RuntimeError:
+        slots.release()
+        raise PoolBusy
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(max(0, deadline - time.monotonic()))
+    except TimeoutError:
+        raise PoolBusy
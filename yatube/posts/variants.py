@@ -0,0 +1,168 @@
+"""Адаптивные варианты картинок постов для <picture> и srcset.
+
+Каждая картинка режется на несколько ширин в современных форматах:
+WebP всегда, AVIF — если Pillow собран с его поддержкой. Варианты
+вписываются в ту же рамку, что и миниатюра из thumbnail_specs, и не
+растягиваются больше исходника. Записи о готовых файлах лежат в
+ImageVariant, поэтому шаблону не нужно трогать файловую систему.
+
+Там же при загрузке запоминаются размеры картинки и крошечная
+размытая копия (LQIP) в data URI: шаблон ставит width/height и фон
+заглушки, не открывая исходник. Для загрузок через форму их считает
+воркер posts.uploads; здесь картинка открывается, только если её
+положили в обход формы.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import ImageVariant, Post
+from .thumbnails import thumbnail_specs
+from .uploads import ProcessedUpload, placeholder, placeholder_size
+
+logger = logging.getLogger(__name__)
+
+variant_formats = ('avif', 'webp')
+variant_widths = (480, 960, 1440)
+variant_quality: int = 80
+exif_orientation = 0x0112
+
+
+def supported_formats():
+    """Форматы из variant_formats, которые умеет записывать Pillow."""
+    Image.init()
+    return [fmt for fmt in variant_formats if fmt.upper() in Image.SAVE]
+
+
+def _box(width):
+    box_width, box_height = map(int, thumbnail_specs[0][0].split('x'))
+    return width, round(width * box_height / box_width)
+
+
+def _open(name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'P')
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _describe(file):
+    image = Image.open(file)
+    width, height = image.size
+    if image.getexif().get(exif_orientation) in (5, 6, 7, 8):
+        width, height = height, width
+    image.draft('RGB', (placeholder_size[0] * 4, placeholder_size[1] * 4))
+    return width, height, placeholder(ImageOps.exif_transpose(image))
+
+
+def describe_image(post):
+    """Заполняет размеры картинки поста и её LQIP-заглушку.
+
+    Загрузка из формы уже описана воркером. Другой только что
+    загруженный файл читается из памяти и перематывается обратно,
+    уже сохранённый — из хранилища. Если картинку прочитать нельзя,
+    поля очищаются, а шаблон обходится без них.
+    """
+    post.image_width = post.image_height = None
+    post.image_placeholder = ''
+    upload = None if post.image._committed else post.image.file
+    if isinstance(upload, ProcessedUpload):
+        (post.image_width, post.image_height,
+         post.image_placeholder) = upload.description
+        return
+    try:
+        if post.image._committed:
+            with default_storage.open(post.image.name) as file:
+                description = _describe(file)
+        else:
+            file = post.image.file
+            file.seek(0)
+            description = _describe(file)
+            file.seek(0)
+    except Exception:
+        logger.warning('Не удалось прочитать картинку %s', post.image.name,
+                       exc_info=True)
+        return
+    post.image_width, post.image_height, post.image_placeholder = description
+
+
+def _save(image, fmt, name):
+    # Имя выводится из имени исходника, а оно — хеш содержимого: готовый
+    # файл уже такой, как нужно, и на него могут ссылаться другие посты.
+    if default_storage.exists(name):
+        return name
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), quality=variant_quality)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(post):
+    """Режет варианты картинки поста и заменяет ими прежние записи."""
+    source = post.image.name
+    digest = hashlib.md5(source.encode()).hexdigest()
+    image = _open(source)
+    variants, sizes = [], set()
+    for width in variant_widths:
+        resized = image.copy()
+        resized.thumbnail(_box(width), Image.LANCZOS)
+        if resized.size in sizes:
+            continue
+        sizes.add(resized.size)
+        for fmt in supported_formats():
+            name = (f'variants/{digest[:2]}/{digest}-{resized.width}'
+                    f'.{fmt}')
+            variants.append(ImageVariant(
+                post=post, source=source, format=fmt,
+                width=resized.width, height=resized.height,
+                file=_save(resized, fmt, name),
+            ))
+    kept = {variant.file.name for variant in variants}
+    stale = list(post.image_variants.exclude(file__in=kept))
+    # Транзакция начинается с записи: в SQLite чтение, переходящее
+    # в запись, не ждёт параллельного воркера, а сразу падает.
+    with transaction.atomic():
+        ImageVariant.objects.filter(post=post).delete()
+        ImageVariant.objects.bulk_create(variants)
+    # Одинаковые загрузки делят исходник, а с ним и файлы вариантов.
+    for variant in stale:
+        name = variant.file.name
+        if not ImageVariant.objects.filter(file=name).exclude(
+                post=post).exists():
+            default_storage.delete(name)
+    return variants
+
+
+def build_for_ids(ids):
+    """Режет варианты для постов из ids; возвращает (готово, с ошибкой)."""
+    done = failed = 0
+    posts = Post.objects.exclude(image='').gather(ids).values()
+    for post in posts:
+        try:
+            build_variants(post)
+        except Exception:
+            logger.exception('Не удалось нарезать варианты %s',
+                             post.image.name)
+            failed += 1
+        else:
+            done += 1
+    return done, failed
+
+
+def picture_sources(post):
+    """Пары (MIME-тип, srcset) для <source> в порядке предпочтения."""
+    by_format = {}
+    for variant in post.image_variants.all():
+        if variant.source == post.image.name:
+            by_format.setdefault(variant.format, []).append(variant)
+    return [
+        (f'image/{fmt}', ', '.join(f'{variant.file.url} {variant.width}w'
+                                   for variant in by_format[fmt]))
+        for fmt in variant_formats if fmt in by_format
+    ]
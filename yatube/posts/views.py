@@ -1,21 +1,59 @@
+import math
+
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from core.queries import query_budget
 
+from . import shards, uploads
+from .cache import (cache_by_generation, cache_follow_feed, group_scope,
+                    index_scope, profile_scope)
+from .counters import get_profile
+from .feeds import entries_to_posts, feed_paginator
 from .forms import PostForm, CommentForm
 from .models import Group, Post, User, Follow
+from .paginators import KeysetPaginator
+from .search import search_posts
 
 posts_per_page: int = 10
-cache_time: int = 20
+comments_per_page: int = 20
+
+
+def get_page_obj(request, posts):
+    return turn_page(request, KeysetPaginator(posts, posts_per_page))
+
+
+def get_merged_page(request, posts):
+    """Страница постов всех авторов; при шардах — слияние по шардам."""
+    if not shards.is_sharded():
+        return get_page_obj(request, posts.select_related('author', 'group'))
+    page_obj = turn_page(request,
+                         shards.merged_paginator(posts, posts_per_page))
+    page_obj.object_list = entries_to_posts(page_obj.object_list)
+    return page_obj
+
 
+def get_post_or_404(queryset, **lookup):
+    """get_object_or_404, который ищет пост во всех шардах."""
+    try:
+        return queryset.locate(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches '
+                      f'the given query.')
 
-@cache_page(cache_time, key_prefix='index_page')
+
+def turn_page(request, paginator):
+    return paginator.get_page(request.GET.get('page'),
+                              after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+
+
+@query_budget(8)
+@cache_by_generation(index_scope)
 def index(request):
-    posts = Post.objects.select_related('author')
-    paginator = Paginator(posts, posts_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_merged_page(request, Post.objects.all())
 
     context = {
         "page_obj": page_obj,
@@ -23,12 +61,12 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(8)
+@cache_by_generation(group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group')
-    paginator = Paginator(posts, posts_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.all()
+    page_obj = get_merged_page(request, posts)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -38,27 +76,83 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(9)
+@cache_by_generation(profile_scope)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('author')
-    paginator = Paginator(posts, posts_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    counter = author.posts.count()
-    following = author.following.exists()
-    context = {'page_obj': page_obj, 'author': author, 'counter': counter,
+    author = get_object_or_404(User.objects.select_related('profile'),
+                               username=username)
+    posts = Post.objects.for_author(author.pk)
+    page_obj = get_page_obj(request, posts.with_related('author', 'group'))
+    author_profile = get_profile(author)
+    following = (request.user.is_authenticated
+                 and author.following.filter(user=request.user).exists())
+    context = {'page_obj': page_obj, 'author': author,
+               'counter': author_profile.posts_count,
+               'author_profile': author_profile,
                'following': following}
     return render(request, 'posts/profile.html', context)
 
 
+def get_comments_page(request, post):
+    """Страница комментариев от новых к старым по курсору ?after=."""
+    comments = post.comments.with_related('author')
+    paginator = KeysetPaginator(comments, comments_per_page,
+                                keys=('created', 'pk'))
+    page = paginator.get_page(after=request.GET.get('after'))
+    page.next_url = page.next_cursor and '{}?after={}'.format(
+        reverse('posts:post_comments', args=[post.pk]), page.next_cursor)
+    return page
+
+
+@query_budget(6)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(
+        Post.objects.with_related('author__profile', 'group'), pk=post_id)
     form = CommentForm(request.POST or None)
-    comments = post.comments.select_related('author', 'post')
-    context = {'post': post, 'form': form, 'comments': comments}
+    comments = get_comments_page(request, post)
+    counter = get_profile(post.author).posts_count
+    context = {'post': post, 'form': form, 'comments': comments,
+               'counter': counter}
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(4)
+def post_comments(request, post_id):
+    """Следующая порция комментариев: HTML-фрагмент или JSON."""
+    post = get_post_or_404(Post.objects.all(), pk=post_id)
+    comments = get_comments_page(request, post)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [{
+                'id': comment.pk,
+                'author': comment.author.username,
+                'text': comment.text,
+                'created': comment.created.isoformat(),
+            } for comment in comments],
+            'next': comments.next_url,
+        })
+    return render(request, 'includes/comments.html', {'comments': comments})
+
+
+@query_budget(6)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = search_posts(query, posts_per_page, request.GET.get('after'))
+    context = {'query': query, 'results': page.results,
+               'next_cursor': page.next_cursor}
+    return render(request, 'posts/search.html', context)
+
+
+def render_post_form(request, context):
+    """Форма поста; 503 с Retry-After, если пул картинок переполнен."""
+    response = render(request, 'posts/create_post.html', context)
+    if context['form'].has_error('image', code='busy'):
+        response.status_code = 503
+        response['Retry-After'] = math.ceil(uploads.timeout())
+    return response
+
+
+@query_budget(12)
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -68,12 +162,13 @@ def post_create(request):
         post.author = request.user
         post.save()
         return redirect('posts:profile', username=post.author)
-    return render(request, 'posts/create_post.html', {'form': form})
+    return render_post_form(request, {'form': form})
 
 
+@query_budget(12)
 @login_required
 def post_edit(request, pk):
-    post = get_object_or_404(Post, pk=pk)
+    post = get_post_or_404(Post.objects.all(), pk=pk)
     is_edit = True
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
@@ -86,12 +181,13 @@ def post_edit(request, pk):
         post.author = request.user
         post.save()
         return redirect('posts:post_detail', pk)
-    return render(request, 'posts/create_post.html', context)
+    return render_post_form(request, context)
 
 
+@query_budget(10)
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(Post.objects.all(), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -101,30 +197,31 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(9)
 @login_required
+@cache_follow_feed
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user)
-    paginator = Paginator(posts, posts_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = turn_page(request,
+                         feed_paginator(request.user, posts_per_page))
+    page_obj.object_list = entries_to_posts(page_obj.object_list)
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(16)
 @login_required
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
-    if author != user and not author.following.exists():
-        Follow.objects.create(user=user, author=author)
+    if author != user:
+        Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
 
 
+@query_budget(14)
 @login_required
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
-    if author != user and author.following.exists():
-        Follow.objects.filter(author=author).delete()
+    Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -51,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PrimaryPinMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +67,12 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# Превышение бюджета запросов вьюхи (core.queries.query_budget) или
+# форма SQL, повторённая больше N_PLUS_ONE_THRESHOLD раз за запрос:
+# 'raise' — исключение, 'log' — предупреждение в лог core.middleware.
+QUERY_BUDGET_ACTION = 'log'
+N_PLUS_ONE_THRESHOLD = 5
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -90,13 +102,39 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Прагмы SQLite (WAL, busy_timeout и другие) ставит core.db на каждое
+# новое соединение; SQLITE_PRAGMAS дополняет или меняет их. Соединение
+# живёт CONN_MAX_AGE секунд и переиспользуется запросами потока.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+SQLITE_PRAGMAS = {}
+
+# Чтение уходит на реплики из DATABASE_REPLICAS (алиасы DATABASES),
+# запись — в default. Кто сам записал, читает с default ещё
+# REPLICA_PIN_SECONDS секунд. Локальная реплика — копия файла, которую
+# обновляет sync_replicas, например:
+#   DATABASES['replica'] = {
+#       'ENGINE': 'django.db.backends.sqlite3',
+#       'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#       'TEST': {'MIRROR': 'default'},
+#   }
+#   DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['posts.shards.ShardRouter', 'core.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 15
+
+# Посты и комментарии раскладываются по шардам POST_SHARDS (алиасы
+# DATABASES) по хешу автора; первый шард хранит посты, написанные до
+# шардирования. Новый шард: добавить алиас, migrate --database, затем
+# reshard переносит авторов, которым хеш выбрал другой шард.
+POST_SHARDS = ['default']
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -139,6 +177,13 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
+# collectstatic кладёт в STATIC_ROOT файлы с хешем в имени и их сжатые
+# копии .gz/.br (см. core.storage); core.media.serve_static отдаёт их
+# с вечным кешем. Bootstrap перед сборкой урезает команда subset_css.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -152,8 +197,60 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Файлы из MEDIA_ROOT отдаёт core.media.serve. Имена по хешу содержимого
+# кешируются на год, остальные — на MEDIA_MAX_AGE секунд с проверкой
+# по ETag. За nginx можно задать префикс internal-локации, например
+# '/protected-media/', и тело файла отдаст прокси по X-Accel-Redirect.
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_ACCEL_REDIRECT = None
+
+# Авторы, у которых подписчиков больше FEED_PULL_THRESHOLD, переходят
+# на доставку при чтении; обратно на рассылку — когда их станет меньше
+# FEED_PUSH_THRESHOLD. Зазор между порогами не даёт режиму «дребезжать».
+# Записи лент после смены режима переносит команда feed_delivery.
+FEED_PULL_THRESHOLD = 10000
+FEED_PUSH_THRESHOLD = 8000
+
+# Миниатюры новых картинок режутся в пуле из THUMBNAIL_WORKERS процессов;
+# в очереди ждут не больше THUMBNAIL_QUEUE_SIZE картинок. 0 воркеров —
+# нарезка прямо после сохранения, без пула.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUEUE_SIZE = 32
+
+# Загруженные картинки проверяются и пересохраняются в пуле из
+# UPLOAD_WORKERS процессов, не больше UPLOAD_QUEUE_SIZE одновременно.
+# Если за UPLOAD_TIMEOUT секунд пул не справился, форма отвечает 503.
+# Картинки больше UPLOAD_MAX_PIXELS пикселей или UPLOAD_MAX_BYTES байт
+# не принимаются.
+UPLOAD_WORKERS = 2
+UPLOAD_QUEUE_SIZE = 8
+UPLOAD_TIMEOUT = 10
+UPLOAD_MAX_PIXELS = 6000 * 4000
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# L1 в памяти каждого процесса, L2 — общий файл SQLite. Для нескольких
+# хостов L2 можно вынести в memcached/redis: добавить его в CACHES
+# и указать алиас в OPTIONS['L2'].
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.caches.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'SYNC_INTERVAL': 1.0,
+        },
     }
 }
+
+# Тесты (manage.py test и pytest) пишут кеш в свой временный файл:
+# cache.clear() в них не должен сбрасывать кеш работающего сайта,
+# а параллельные прогоны — мешать друг другу.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    TEST_CACHE_DIR = tempfile.mkdtemp(prefix='yatube-cache-')
+    atexit.register(shutil.rmtree, TEST_CACHE_DIR, ignore_errors=True)
+    CACHES['default']['LOCATION'] = os.path.join(TEST_CACHE_DIR,
+                                                 'cache.sqlite3')
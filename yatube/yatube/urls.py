@@ -1,13 +1,19 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
 
+from core import media
+
 urlpatterns = [
     path('', include('posts.urls', namespace='posts_app')),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', media.serve,
+            name='media'),
+    re_path(rf'^{settings.STATIC_URL.lstrip("/")}(?P<path>.+)$',
+            media.serve_static, name='static'),
 ]
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'